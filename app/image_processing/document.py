@@ -0,0 +1,103 @@
+import os
+from typing import Optional, Tuple
+import numpy as np
+import cv2
+
+from app.services.metrics import metrics
+
+DOCUMENT_CROP = os.getenv("DOCUMENT_CROP", "1") == "1"
+
+DOC_WORK_SIDE = 640          # edge detection runs on a copy this large
+DOC_MIN_AREA = 0.15          # of the frame; smaller quads are text blocks, not the document
+DOC_MAX_AREA = 0.95          # larger ones mean the document already fills the frame
+DOC_ASPECT_TOLERANCE = 0.25
+DOC_MIN_SIDE = 250
+
+# width / height of the upright document (ICAO 9303 sizes)
+DOC_ASPECT = {
+    "passport": 125.0 / 88.0,    # TD3 data page
+    "id_card": 85.6 / 53.98,     # TD1 card
+}
+
+
+def _order_corners(pts: np.ndarray) -> np.ndarray:
+    """top-left, top-right, bottom-right, bottom-left"""
+    pts = pts.reshape(4, 2).astype(np.float32)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+
+def _side_lengths(quad: np.ndarray) -> tuple:
+    tl, tr, br, bl = quad
+    w = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+    h = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+    return float(w), float(h)
+
+
+def find_document_quad(img_bgr: np.ndarray, aspect: float) -> Optional[np.ndarray]:
+    """
+    Corners of the largest convex quadrilateral whose area and side ratio
+    fit a document of the given aspect (either orientation), in image pixels.
+    """
+    h, w = img_bgr.shape[:2]
+    scale = min(1.0, DOC_WORK_SIDE / float(max(h, w)))
+    small = cv2.resize(img_bgr, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(gray, 50, 150)
+    edges = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    frame_area = float(small.shape[0] * small.shape[1])
+
+    for c in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        area = cv2.contourArea(c)
+        if area < DOC_MIN_AREA * frame_area:
+            break
+        if area > DOC_MAX_AREA * frame_area:
+            continue
+
+        approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+
+        quad = _order_corners(approx) / scale
+        qw, qh = _side_lengths(quad)
+        ratio = max(qw, qh) / max(1.0, min(qw, qh))
+        if abs(ratio - aspect) > DOC_ASPECT_TOLERANCE * aspect:
+            continue
+        return quad
+
+    return None
+
+
+def crop_document(img_bgr: np.ndarray, document_type: str) -> Tuple[np.ndarray, bool]:
+    """
+    Perspective-corrected crop of the document, warped to its canonical
+    aspect without upscaling. Portrait quads stay portrait; turning them
+    upright is left to orientation. Returns the input and False when
+    nothing fits.
+    """
+    aspect = DOC_ASPECT.get(document_type)
+    if not DOCUMENT_CROP or aspect is None:
+        return img_bgr, False
+
+    quad = find_document_quad(img_bgr, aspect)
+    if quad is None:
+        metrics.inc("document.not_found")
+        return img_bgr, False
+
+    qw, qh = _side_lengths(quad)
+    long_side = int(round(max(qw, qh)))
+    short_side = int(round(long_side / aspect))
+    if short_side < DOC_MIN_SIDE:
+        return img_bgr, False
+    out_w, out_h = (long_side, short_side) if qw >= qh else (short_side, long_side)
+
+    dst = np.array([[0, 0], [out_w - 1, 0], [out_w - 1, out_h - 1], [0, out_h - 1]], dtype=np.float32)
+    m = cv2.getPerspectiveTransform(quad, dst)
+    metrics.inc("document.cropped")
+    warped = cv2.warpPerspective(img_bgr, m, (out_w, out_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return warped, True
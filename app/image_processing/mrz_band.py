@@ -0,0 +1,63 @@
+from typing import Tuple
+import numpy as np
+import cv2
+
+MRZ_SEARCH_FRACTION = 0.45   # lower part of the page where the band is searched
+MRZ_FALLBACK_FRACTION = 0.25
+MRZ_BAND_PAD = 0.03
+MRZ_WORK_WIDTH = 600
+
+
+def _find_band_rows(gray: np.ndarray) -> Tuple[int, int] | None:
+    h, w = gray.shape[:2]
+    scale = MRZ_WORK_WIDTH / float(w) if w > MRZ_WORK_WIDTH else 1.0
+    small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    sh, sw = small.shape[:2]
+
+    rect = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+    sq = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21))
+
+    # dark text on a light background -> bright strokes
+    blackhat = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, rect)
+    grad = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, rect)
+    _, th = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    th = cv2.morphologyEx(th, cv2.MORPH_CLOSE, sq)
+    th = cv2.erode(th, None, iterations=2)
+
+    contours, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    rows = None
+    for c in contours:
+        x, y, cw, ch = cv2.boundingRect(c)
+        # MRZ lines span most of the page width and are much wider than tall
+        if cw < 0.6 * sw or cw < 5 * ch:
+            continue
+        rows = (y, y + ch) if rows is None else (min(rows[0], y), max(rows[1], y + ch))
+
+    if rows is None:
+        return None
+
+    return int(rows[0] / scale), int(rows[1] / scale)
+
+
+def crop_mrz_band(img_bgr: np.ndarray) -> np.ndarray:
+    """
+    Crops the machine readable zone of an upright TD3 page (two 44-char
+    lines at the bottom). Falls back to the bottom strip of the image.
+    """
+    h = img_bgr.shape[0]
+    top = int(h * (1 - MRZ_SEARCH_FRACTION))
+
+    gray = cv2.cvtColor(img_bgr[top:], cv2.COLOR_BGR2GRAY)
+    rows = _find_band_rows(gray)
+
+    if rows is None:
+        return img_bgr[int(h * (1 - MRZ_FALLBACK_FRACTION)):]
+
+    pad = int(h * MRZ_BAND_PAD)
+    y0 = max(0, top + rows[0] - pad)
+    y1 = min(h, top + rows[1] + pad)
+    return img_bgr[y0:y1]
@@ -1,8 +1,22 @@
-from typing import Optional
+import os
+from typing import List, Optional, Tuple
 from paddleocr import DocImgOrientationClassification
+import threading
 import numpy as np
 import cv2
 
+from app.services.metrics import metrics
+
+# Thumbnail text-line / MRZ heuristic before the classifier
+ORIENTATION_HEURISTIC = os.getenv("ORIENTATION_HEURISTIC", "1") == "1"
+
+ORI_THUMB_SIDE = 480         # heuristic works on a gray copy this large
+ORI_CLASSIFIER_SIDE = 448    # classifier input (it resizes to 224 itself)
+ORI_LINE_DOMINANCE = 1.5     # row vs column projection variance for horizontal text
+ORI_MRZ_FRACTION = 0.4       # the MRZ block must sit within this share of the bottom
+ORI_MRZ_WIDTH_TOLERANCE = 0.06   # MRZ lines have the same character count in a monospaced font
+ORI_MRZ_ALIGN_TOLERANCE = 0.02   # and the same left edge (share of the page width)
+
 ori = DocImgOrientationClassification(
     model_name="PP-LCNet_x1_0_doc_ori",
     device="cpu",
@@ -10,6 +24,9 @@ ori = DocImgOrientationClassification(
     cpu_threads=4,
 )
 
+# Shared by all inference executor threads, see app/services/inference.py
+_ori_lock = threading.Lock()
+
 def _rotate_clockwise_90k(img_bgr: np.ndarray, k: int) -> np.ndarray:
     k %= 4
     if k == 0:
@@ -17,12 +34,85 @@ def _rotate_clockwise_90k(img_bgr: np.ndarray, k: int) -> np.ndarray:
     return np.ascontiguousarray(np.rot90(img_bgr, 4 - k))
 
 
+def _thumbnail(img_bgr: np.ndarray, side: int) -> np.ndarray:
+    h, w = img_bgr.shape[:2]
+    scale = min(1.0, side / float(max(h, w)))
+    if scale == 1.0:
+        return img_bgr
+    return cv2.resize(img_bgr, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def _text_mask(gray: np.ndarray) -> np.ndarray:
+    """Dark strokes on light background, smeared along text lines."""
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 3)))
+    _, th = cv2.threshold(blackhat, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return cv2.morphologyEx(th, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+
+
+def _mrz_block(lines: List[Tuple[int, int, int, int]], page_w: int) -> Optional[Tuple[int, int]]:
+    """
+    Vertical extent of 3 (TD1) or 2 (TD3) consecutive wide lines stacked
+    like an MRZ: equal width, same left edge, similar height, close
+    together. A single wide line (a header) never qualifies.
+    """
+    lines = sorted(lines, key=lambda r: r[1])
+    for n in (3, 2):
+        for i in range(len(lines) - n + 1):
+            block = lines[i:i + n]
+            widths = [cw for _x, _y, cw, _ch in block]
+            heights = [ch for _x, _y, _cw, ch in block]
+            lefts = [x for x, _y, _cw, _ch in block]
+            if max(widths) - min(widths) > ORI_MRZ_WIDTH_TOLERANCE * max(widths):
+                continue
+            if max(lefts) - min(lefts) > ORI_MRZ_ALIGN_TOLERANCE * page_w:
+                continue
+            if max(heights) > 2 * min(heights):
+                continue
+            gaps = [b[1] - (a[1] + a[3]) for a, b in zip(block, block[1:])]
+            if any(g > 2 * max(heights) for g in gaps):
+                continue
+            return block[0][1], block[-1][1] + block[-1][3]
+    return None
+
+
+def _orient_by_heuristic(img_bgr: np.ndarray) -> Optional[int]:
+    """
+    Rotation (k, see _rotate_clockwise_90k) read off a thumbnail, or None.
+    Horizontal text lines give row projections with far more variance than
+    column projections; an MRZ block at the bottom then means upright.
+    Anything else, including an MRZ-like block at the top, is left to the
+    classifier: a 180° turn is never decided from the thumbnail alone.
+    """
+    gray = cv2.cvtColor(_thumbnail(img_bgr, ORI_THUMB_SIDE), cv2.COLOR_BGR2GRAY)
+    mask = _text_mask(gray)
+
+    rows = mask.mean(axis=1)
+    cols = mask.mean(axis=0)
+    if rows.var() < ORI_LINE_DOMINANCE * cols.var():
+        return None
+
+    h, w = mask.shape
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    lines = []
+    for c in contours:
+        x, y, cw, ch = cv2.boundingRect(c)
+        # MRZ lines span most of the width and are much wider than tall
+        if cw >= 0.6 * w and cw >= 8 * ch:
+            lines.append((x, y, cw, ch))
+
+    block = _mrz_block(lines, w)
+    if block is not None and block[0] >= (1 - ORI_MRZ_FRACTION) * h:
+        return 0
+    return None
+
+
 def _orient_by_paddle_doc_classifier(img_bgr: np.ndarray, *, min_score: float = 0.60) -> Optional[np.ndarray]:
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    img_rgb = cv2.cvtColor(_thumbnail(img_bgr, ORI_CLASSIFIER_SIDE), cv2.COLOR_BGR2RGB)
 
     try:
-        out_iter = ori.predict(img_rgb, batch_size=1)
-        res = next(iter(out_iter)) 
+        with _ori_lock:
+            out_iter = ori.predict(img_rgb, batch_size=1)
+            res = next(iter(out_iter)) 
         payload = res.json 
         info = payload.get("res", {}) if isinstance(payload, dict) else {}
         label = (info.get("label_names") or [None])[0]
@@ -40,6 +130,17 @@ def _orient_by_paddle_doc_classifier(img_bgr: np.ndarray, *, min_score: float =
 
 
 def normalize_orientation(img_bgr: np.ndarray) -> np.ndarray:
+    """
+    EXIF orientation is already applied by cv2.imdecode. Then the thumbnail
+    heuristic; the classifier only runs when it is inconclusive.
+    """
+    if ORIENTATION_HEURISTIC:
+        k = _orient_by_heuristic(img_bgr)
+        if k is not None:
+            metrics.inc("orientation.heuristic.upright")
+            return _rotate_clockwise_90k(img_bgr, k)
+
+    metrics.inc("orientation.classifier")
     oriented = _orient_by_paddle_doc_classifier(img_bgr, min_score=0.60)
     if oriented is not None:
         return oriented
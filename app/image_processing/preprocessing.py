@@ -1,18 +1,95 @@
+import os
 import numpy as np
 import cv2
 from PIL import Image
 import io
-from fastapi import HTTPException, UploadFile
-from typing import Tuple, Dict, Optional
-from pyzbar.pyzbar import decode
+from fastapi import HTTPException, Request, UploadFile
+import struct
+from typing import Any, NamedTuple, Tuple, Dict, Optional
 from app.image_processing.orientation import normalize_orientation
+from app.image_processing.document import crop_document
+from app.services.metrics import metrics
 
 MAX_SIDE_PX = 2000
 MAX_IMAGE_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 256 * 1024
 MIN_W, MIN_H = 250, 250
 ALLOWED_MIME_PREFIX = "image/"
 ALLOWED_FORMATS = {"jpeg", "jpg", "png"}
 
+# Quality gate: photos that cannot be read are refused before orientation and OCR
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "20"))    # variance of the Laplacian
+QUALITY_MAX_GLARE = float(os.getenv("QUALITY_MAX_GLARE", "0.08"))          # share taken by the largest highlight
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))  # mean gray level, 0-255
+
+QUALITY_THUMB_SIDE = 512     # measurements run on a gray copy this large
+QUALITY_SATURATED = 250      # gray level counted as blown out
+QUALITY_GLARE_MIN_SIDE = 9   # px on the thumbnail; thinner white gaps (between text lines) are no highlight
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start-of-frame markers (C4 DHT, C8 JPG and CC DAC share the range)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _sniff_jpeg(data: bytes) -> Optional[ImageHeader]:
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:          # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:   # no length field
+            i += 2
+            continue
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        if marker in _JPEG_SOF:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return ImageHeader("jpeg", width, height)
+        if marker == 0xDA:          # scan data before any frame header
+            return None
+        i += 2 + length
+    return None
+
+
+def sniff_image(data: bytes) -> Optional[ImageHeader]:
+    """Format and size from the magic bytes and header only (PNG IHDR, JPEG SOF)."""
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b"IHDR" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return ImageHeader("png", width, height)
+    if data[:2] == b"\xff\xd8":
+        return _sniff_jpeg(data)
+    return None
+
+
+def check_image_header(data: bytes, field_name: str) -> ImageHeader:
+    """Format and minimum size checks that need no pixel decode."""
+    header = sniff_image(data)
+    if header is None or header.format not in ALLOWED_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{field_name} format not allowed (detected: {_detect_image_format(data)})"
+        )
+
+    if header.width < MIN_W or header.height < MIN_H:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{field_name} resolution too small ({header.width}x{header.height}); need at least {MIN_W}x{MIN_H}"
+        )
+
+    return header
+
 
 def _detect_image_format(data: bytes) -> str:
     try:
@@ -36,20 +113,138 @@ def _resize_to_max_side(img: np.ndarray, max_side: int = MAX_SIDE_PX) -> Tuple[n
     return resized, {"scale": scale}
 
 
-def _bytes_to_bgr_image(data: bytes) -> np.ndarray:
+def downscale(img: np.ndarray, max_side: int) -> np.ndarray:
+    """Resolution ladder step: `img` with its longer side at most `max_side`."""
+    return _resize_to_max_side(img, max_side)[0]
+
+
+# JPEG DCT scaling: decode at 1/8, 1/4 or 1/2 size instead of full size
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _decode_flag(header: Optional[ImageHeader], max_side: int) -> int:
+    """
+    Picks the strongest reduced JPEG decode that still leaves the longer
+    side at or above `max_side`.
+    """
+    if header is None or header.format != "jpeg":
+        return cv2.IMREAD_COLOR
+
+    longer = max(header.width, header.height)
+    for factor, flag in _REDUCED_FLAGS:
+        if longer // factor >= max_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def _bytes_to_bgr_image(
+    data: bytes,
+    header: Optional[ImageHeader] = None,
+    max_side: int = MAX_SIDE_PX,
+) -> np.ndarray:
     arr = np.frombuffer(data, dtype=np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(arr, _decode_flag(header, max_side))
     if img is None:
         raise ValueError("Invalid image: cv2.imdecode failed (bad/unsupported/corrupted file)")
     return img
 
 
-async def read_and_validate_image(
+class ImageQuality(NamedTuple):
+    sharpness: float
+    glare: float
+    brightness: float
+
+
+def _largest_highlight(gray: np.ndarray) -> float:
+    """
+    Share of the image taken by its largest clipped blob. Blobs touching
+    three or more sides are the page or background itself (white paper,
+    scans), not a highlight on it.
+    """
+    mask = (gray >= QUALITY_SATURATED).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (QUALITY_GLARE_MIN_SIDE, QUALITY_GLARE_MIN_SIDE))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    n, _labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+    h, w = gray.shape[:2]
+    largest = 0
+    for x, y, bw, bh, area in stats[1:n]:
+        sides = int(x == 0) + int(y == 0) + int(x + bw == w) + int(y + bh == h)
+        if sides < 3 and area > largest:
+            largest = area
+    return largest / float(gray.size)
+
+
+def measure_quality(img: np.ndarray) -> ImageQuality:
+    h, w = img.shape[:2]
+    scale = min(1.0, QUALITY_THUMB_SIDE / float(max(h, w)))
+    if scale < 1.0:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    return ImageQuality(
+        sharpness=float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        glare=_largest_highlight(gray),
+        brightness=float(gray.mean()),
+    )
+
+
+def check_image_quality(img: np.ndarray, field_name: str, *, check_glare: bool = True) -> ImageQuality:
+    """
+    Refuses photos too blurry, washed out by glare or too dark for OCR with
+    a 422 whose detail carries a machine-readable `reason`. Glare is only
+    judged on a located document crop (`check_glare`); in a whole frame a
+    white desk or scan background cannot be told from a highlight.
+    """
+    q = measure_quality(img)
+
+    if q.brightness < QUALITY_MIN_BRIGHTNESS:
+        reason, value, limit, message = "too_dark", q.brightness, QUALITY_MIN_BRIGHTNESS, "is too dark"
+    elif check_glare and q.glare > QUALITY_MAX_GLARE:
+        reason, value, limit, message = "glare", q.glare, QUALITY_MAX_GLARE, "has too much glare"
+    elif q.sharpness < QUALITY_MIN_SHARPNESS:
+        reason, value, limit, message = "blurry", q.sharpness, QUALITY_MIN_SHARPNESS, "is too blurry"
+    else:
+        metrics.inc("quality.passed")
+        return q
+
+    metrics.inc(f"quality.rejected.{reason}")
+    raise HTTPException(
+        status_code=422,
+        detail={
+            "reason": reason,
+            "field": field_name,
+            "message": f"{field_name} {message} to read, retake the photo",
+            "value": round(value, 3),
+            "threshold": limit,
+        },
+    )
+
+
+def _too_large(field_name: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{field_name} is too large (>{MAX_IMAGE_BYTES // (1024*1024)}MB)"
+    )
+
+
+async def read_image_upload(
     file: UploadFile,
     field_name: str,
     *,
     required: bool = True,
-) -> np.ndarray:
+    lease: Any = None,
+) -> Optional[memoryview]:
+    """
+    Reads the upload in chunks into one buffer sized (and capped) up front,
+    aborting as soon as MAX_IMAGE_BYTES is exceeded. The returned view is
+    decoded without further copies. `lease` (see services/upload_limit.py)
+    is charged for the buffer.
+    """
     if file is None:
         if required:
             raise HTTPException(status_code=400, detail=f"{field_name} is required")
@@ -58,55 +253,117 @@ async def read_and_validate_image(
     if not file.content_type or not file.content_type.startswith(ALLOWED_MIME_PREFIX):
         raise HTTPException(status_code=400, detail=f"{field_name} must be an image file (jpeg, jpg, png)")
 
-    data = await file.read()
+    size = file.size
+    if size is not None and size > MAX_IMAGE_BYTES:
+        raise _too_large(field_name)
+
+    cap = size if size is not None else MAX_IMAGE_BYTES
+    if lease is not None:
+        lease.take(cap)
 
-    if not data:
+    buf = bytearray(cap)
+    n = 0
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        if n + len(chunk) > cap:
+            raise _too_large(field_name)
+        buf[n:n + len(chunk)] = chunk
+        n += len(chunk)
+
+    if not n:
         raise HTTPException(status_code=400, detail=f"{field_name} is empty")
 
+    data = memoryview(buf)[:n]
+
+    # reject on the event loop, before the upload is queued for decoding
+    check_image_header(data, field_name)
+
+    return data
+
+
+RAW_CONTENT_TYPE = "application/octet-stream"
+# ID card body of the raw endpoint: front and back image, each prefixed
+# with its length as a 4-byte big-endian unsigned integer
+CONTAINER_PREFIX_BYTES = 4
+
+
+async def read_raw_body(request: Request, *, max_bytes: int, lease: Any = None) -> memoryview:
+    """read_image_upload for an application/octet-stream request body."""
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith(RAW_CONTENT_TYPE):
+        raise HTTPException(status_code=400, detail=f"Request body must be {RAW_CONTENT_TYPE}")
+
+    too_large = HTTPException(status_code=413, detail=f"Request body is too large (>{max_bytes // (1024*1024)}MB)")
+
+    length = request.headers.get("content-length", "")
+    cap = int(length) if length.isdigit() else max_bytes
+    if cap > max_bytes:
+        raise too_large
+
+    if lease is not None:
+        lease.take(cap)
+
+    buf = bytearray(cap)
+    n = 0
+    async for chunk in request.stream():
+        if n + len(chunk) > cap:
+            raise too_large
+        buf[n:n + len(chunk)] = chunk
+        n += len(chunk)
+
+    return memoryview(buf)[:n]
+
+
+def check_image_bytes(data: memoryview, field_name: str) -> memoryview:
+    if not len(data):
+        raise HTTPException(status_code=400, detail=f"{field_name} is empty")
     if len(data) > MAX_IMAGE_BYTES:
-        raise HTTPException(
-            status_code=413,
-            detail=f"{field_name} is too large (>{MAX_IMAGE_BYTES // (1024*1024)}MB)"
-        )
+        raise _too_large(field_name)
+    check_image_header(data, field_name)
+    return data
 
-    try:
-        img = _bytes_to_bgr_image(data)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"{field_name}: {str(e)}")
 
-    h, w = img.shape[:2]
+def split_front_back(data: memoryview) -> Tuple[memoryview, memoryview]:
+    """Splits the length-prefixed ID card container without copying."""
+    parts = []
+    offset = 0
+    for _ in range(2):
+        end = offset + CONTAINER_PREFIX_BYTES
+        if end > len(data):
+            raise HTTPException(status_code=400, detail="Malformed ID card body: truncated length prefix")
+        size = int.from_bytes(data[offset:end], "big")
+        if end + size > len(data):
+            raise HTTPException(status_code=400, detail="Malformed ID card body: truncated image")
+        parts.append(data[end:end + size])
+        offset = end + size
 
-    if w < MIN_W or h < MIN_H:
-        raise HTTPException(
-            status_code=400,
-            detail=f"{field_name} resolution too small ({w}x{h}); need at least {MIN_W}x{MIN_H}"
-        )
+    if offset != len(data):
+        raise HTTPException(status_code=400, detail="Malformed ID card body: trailing bytes")
 
-    img, _resize_info = _resize_to_max_side(img, MAX_SIDE_PX)
+    return parts[0], parts[1]
 
-    fmt = _detect_image_format(data)
-    if fmt not in ALLOWED_FORMATS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"{field_name} format not allowed (detected: {fmt})"
-        )
 
-    img = normalize_orientation(img)
-    
-    return img
+def prepare_image(data: bytes, field_name: str, document_type: Optional[str] = None) -> np.ndarray:
+    """
+    Blocking part of image validation: header checks, decode, resize,
+    document crop (when `document_type` is given), quality gate, orientation.
+    Meant to run on the inference executor, not on the event loop.
+    """
+    header = check_image_header(data, field_name)
 
+    try:
+        img = _bytes_to_bgr_image(data, header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{field_name}: {str(e)}")
 
-def extract_qr(img_bgr: np.ndarray) -> Optional[str]:
-    if img_bgr is None:
-        return None
+    img, _resize_info = _resize_to_max_side(img, MAX_SIDE_PX)
 
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    cropped = False
+    if document_type is not None:
+        img, cropped = crop_document(img, document_type)
 
-    results = decode(gray)
-    for r in results:
-        if r.type == "QRCODE":
-            s = r.data.decode("utf-8", errors="ignore").strip()
-            if s:
-                return s
-    return None
+    if QUALITY_GATE:
+        check_image_quality(img, field_name, check_glare=cropped)
 
+    img = normalize_orientation(img)
+    
+    return img
@@ -0,0 +1,113 @@
+import threading
+from typing import List, Optional
+import numpy as np
+import cv2
+from pyzbar.pyzbar import decode
+
+from app.services.metrics import metrics
+
+QR_DETECT_SIDES = (800, 1600)    # pyramid levels searched for finder patterns, in order
+QR_CROP_PAD = 0.2            # of the code size, quiet zone for pyzbar
+QR_UPSCALE = (1.0, 2.0)      # crop scales tried in order
+
+_local = threading.local()
+
+
+def _detector() -> cv2.QRCodeDetector:
+    # QRCodeDetector keeps state between calls, one per executor thread
+    if not hasattr(_local, "detector"):
+        _local.detector = cv2.QRCodeDetector()
+    return _local.detector
+
+
+def _pyzbar(gray: np.ndarray) -> Optional[str]:
+    for r in decode(gray):
+        if r.type == "QRCODE":
+            s = r.data.decode("utf-8", errors="ignore").strip()
+            if s:
+                return s
+    return None
+
+
+def _candidates(gray: np.ndarray) -> List[np.ndarray]:
+    """
+    QR quad (full-resolution corner points) from the smallest pyramid level
+    where the finder patterns are found; larger levels only when needed.
+    """
+    h, w = gray.shape[:2]
+    for side in QR_DETECT_SIDES:
+        scale = min(1.0, side / float(max(h, w)))
+        small = gray if scale == 1.0 else cv2.resize(
+            gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA
+        )
+
+        try:
+            found, points = _detector().detect(small)
+        except cv2.error:
+            found, points = False, None
+        if found and points is not None:
+            return [points.reshape(-1, 2) / scale]
+        if scale == 1.0:
+            break
+    return []
+
+
+def _crop(gray: np.ndarray, quad: np.ndarray) -> np.ndarray:
+    h, w = gray.shape[:2]
+    x0, y0 = quad.min(axis=0)
+    x1, y1 = quad.max(axis=0)
+    pad = QR_CROP_PAD * max(x1 - x0, y1 - y0)
+    x0, y0 = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+    x1, y1 = min(w, int(x1 + pad)), min(h, int(y1 + pad))
+    return gray[y0:y1, x0:x1]
+
+
+def _decode_crop(crop: np.ndarray) -> Optional[str]:
+    for scale in QR_UPSCALE:
+        img = crop if scale == 1.0 else cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        s = _pyzbar(img)
+        if s:
+            return s
+    return None
+
+
+def _cv2_decode(gray: np.ndarray) -> Optional[str]:
+    try:
+        s, _points, _ = _detector().detectAndDecode(gray)
+    except cv2.error:
+        return None
+    return s.strip() or None
+
+
+def extract_qr(img_bgr: np.ndarray) -> Optional[str]:
+    """
+    1. finder-pattern detection on a downscaled level, pyzbar on each
+       candidate crop (upscaled when the first try fails)
+    2. pyzbar on the whole image (previous behaviour)
+    3. OpenCV's own decoder on the located crops as the last resort
+    """
+    if img_bgr is None:
+        return None
+
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+
+    crops = [_crop(gray, quad) for quad in _candidates(gray)]
+    for crop in crops:
+        s = _decode_crop(crop)
+        if s:
+            metrics.inc("qr.hit.crop")
+            return s
+
+    s = _pyzbar(gray)
+    if s:
+        metrics.inc("qr.hit.full")
+        return s
+
+    for crop in crops:
+        s = _cv2_decode(crop)
+        if s:
+            metrics.inc("qr.hit.cv2")
+            return s
+
+    metrics.inc("qr.miss")
+    return None
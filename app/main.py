@@ -1,16 +1,31 @@
-from fastapi import HTTPException, Depends
+import json
+import asyncio
+import sqlite3
+from typing import AbstractSet, Any, AsyncIterator, Awaitable, Callable, List, Literal, Optional, Tuple
 
-from app.parser.id_card.parser import parse_id_card
-from app.parser.passport.parser import parse_passport
+from fastapi import HTTPException, Depends, File, Form, Header, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 
-
-from app.services.ocr_service import extract_texts
-from app.image_processing.preprocessing import read_and_validate_image, extract_qr   
+from app.image_processing.preprocessing import (
+    CONTAINER_PREFIX_BYTES,
+    MAX_IMAGE_BYTES,
+    check_image_bytes,
+    read_image_upload,
+    read_raw_body,
+    split_front_back,
+)
 from app.services.api import app
+from app.services.inference import InferenceQueueFull
+from app.services.jobs import JOBS_MAX_DOCUMENTS, job_store
+from app.services.metrics import metrics, StageTimings
+from app.services.pipeline import process_document
+from app.services.upload_limit import UploadBudgetExceeded, upload_budget
 
-from app.schemas.ocr_response import OcrResponse, IdCardResponse, PassportResponse
-from app.schemas.response import ERROR_401
-from app.schemas.ocr_request import get_ocr_form
+from app.schemas.ocr_response import OcrResponse
+from app.schemas.jobs import JobResultsPage, JobStatus
+from app.schemas.metrics import MetricsResponse
+from app.schemas.response import ERROR_401, ERROR_404, ERROR_422, ERROR_503, ERROR_503_JOBS
+from app.schemas.ocr_request import FIELDS_DESC, MRZ_ONLY_DESC, get_ocr_form, parse_fields
 
 
 OCR_DESC = """
@@ -18,50 +33,327 @@ Upload document photos as **multipart/form-data**. Behavior depends on `isIdCard
 
 - `false` → Passport: requires `frontPhoto`
 - `true` → ID card: requires `frontPhoto` and `backPhoto`
+
+Passports may set `mrzOnly=true` to read only the MRZ band when just the MRZ
+fields are needed.
+
+`fields` (e.g. `card_number,date_of_birth,personal_number`) limits the result
+to those fields; the others are null and `raw` is returned only when listed.
+Unrequested fields are not parsed, and a selection of MRZ fields is served
+from the MRZ band (passport) or a verified QR code (ID card) without
+full-page OCR.
+
+Stage durations of the request are returned in the `Server-Timing` header.
+
+Results are cached by image content. Send `Cache-Control: no-cache` to force
+a fresh OCR run, or `no-store` to neither read nor write the cache.
+"""
+
+OCR_RAW_DESC = """
+Same as `/ocr` for callers that already hold the images in memory: the body
+is sent as **application/octet-stream** instead of multipart/form-data.
+
+- `isIdCard=false` → the body is the passport photo
+- `isIdCard=true` → the body is the front photo and then the back photo,
+  each preceded by its length in bytes as a 4-byte big-endian integer
+"""
+
+JOBS_DESC = """
+Queues a batch of documents for OCR and returns at once with `202` and the
+job status. The documents are processed in the background by the same
+pipeline as `/ocr`; poll `GET /jobs/{job_id}` and collect the results from
+`GET /jobs/{job_id}/results`.
+
+- `isIdCard=false` → one passport per `frontPhotos` part
+- `isIdCard=true` → `frontPhotos` and `backPhotos` are paired by order
+
+`mrzOnly` and `fields` apply to every document. Each photo is checked as for
+`/ocr`; one invalid photo rejects the whole batch and names it, e.g.
+`frontPhotos[3]`. Photos refused later (quality gate) only fail their own
+document.
+
+Jobs are kept in a SQLite file and survive a restart; documents that were
+being processed are picked up again.
+"""
+
+JOB_RESULTS_DESC = """
+Per-document results in submission order, `limit` at a time from `offset`.
+Documents not finished yet are listed with their status and no result.
+
+`format=jsonl` streams every document from `offset` on as one JSON object
+per line (`application/x-ndjson`) instead of a page.
 """
 
+JOB_RESULTS_STREAM_PAGE = 100
+
+ReadImages = Callable[[Any], Awaitable[Tuple[Any, Optional[Any]]]]
+
+
+async def _ocr(
+    response: Response,
+    read_images: ReadImages,
+    *,
+    mrz_only: bool,
+    fields: Optional[AbstractSet[str]] = None,
+    cache_control: str | None,
+):
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    no_store = "no-store" in directives
+
+    timings = StageTimings()
+    try:
+        # upload buffers count against the worker's budget until the response is built
+        with upload_budget.lease() as lease:
+            front_data, back_data = await read_images(lease)
+
+            result = await process_document(
+                front_data,
+                back_data,
+                timings,
+                mrz_only=mrz_only,
+                fields=fields,
+                cache_read=not no_store and "no-cache" not in directives,
+                cache_write=not no_store,
+            )
+
+        timings.finish()
+        response.headers["Server-Timing"] = timings.server_timing()
+        return result
+
+    except HTTPException:
+        raise
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="OCR queue is full, retry later")
+    except UploadBudgetExceeded:
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, retry later")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
+
+
 @app.post(
     "/ocr",
     response_model=OcrResponse,
     summary="OCR passport or ID card",
     description=OCR_DESC,
     responses={
-        401: ERROR_401
+        401: ERROR_401,
+        422: ERROR_422,
+        503: ERROR_503,
     }
 )
-async def ocr_image(form=Depends(get_ocr_form)):
+async def ocr_image(
+    response: Response,
+    form=Depends(get_ocr_form),
+    cache_control: str | None = Header(None, include_in_schema=False),
+):
     if form.isIdCard and form.backPhoto is None:
        raise HTTPException(status_code=400, detail="backPhoto is required when isIdCard is true")
 
-    try:
-        front_img = await read_and_validate_image(form.frontPhoto, "frontPhoto", required=True)
-        front_rec_texts = extract_texts(front_img)
+    async def read_images(lease):
+        front_data = await read_image_upload(form.frontPhoto, "frontPhoto", required=True, lease=lease)
 
-        back_img = (None)
-        qr = None
-        back_rec_texts = []
+        back_data = None
         if form.isIdCard:
-           back_img = await read_and_validate_image(form.backPhoto, "backPhoto", required=True)
-           back_rec_texts = extract_texts(back_img)
-           qr = extract_qr(back_img)
+            back_data = await read_image_upload(form.backPhoto, "backPhoto", required=True, lease=lease)
 
-        all_rec_texts = front_rec_texts + back_rec_texts
+        return front_data, back_data
 
+    return await _ocr(
+        response,
+        read_images,
+        mrz_only=form.mrzOnly,
+        fields=form.fields,
+        cache_control=cache_control,
+    )
 
-        if form.isIdCard:
-            return IdCardResponse(
-                status="ok",
-                document_type="id_card",
-                result=parse_id_card(all_rec_texts, qr),
-            )
 
-        return PassportResponse(
-            status="ok",
-            document_type="passport",
-            result=parse_passport(all_rec_texts),
+@app.post(
+    "/ocr/raw",
+    response_model=OcrResponse,
+    summary="OCR passport or ID card from raw image bytes",
+    description=OCR_RAW_DESC,
+    responses={
+        401: ERROR_401,
+        422: ERROR_422,
+        503: ERROR_503,
+    }
+)
+async def ocr_raw(
+    request: Request,
+    response: Response,
+    isIdCard: bool = Query(False, description="Body is the ID card front/back container"),
+    mrzOnly: bool = Query(False, description=MRZ_ONLY_DESC),
+    fields: Optional[str] = Query(None, description=FIELDS_DESC),
+    cache_control: str | None = Header(None, include_in_schema=False),
+):
+    selected = parse_fields(fields, isIdCard)
+
+
+    async def read_images(lease):
+        if not isIdCard:
+            body = await read_raw_body(request, max_bytes=MAX_IMAGE_BYTES, lease=lease)
+            return check_image_bytes(body, "frontPhoto"), None
+
+        max_bytes = 2 * (MAX_IMAGE_BYTES + CONTAINER_PREFIX_BYTES)
+        body = await read_raw_body(request, max_bytes=max_bytes, lease=lease)
+        front, back = split_front_back(body)
+        return check_image_bytes(front, "frontPhoto"), check_image_bytes(back, "backPhoto")
+
+    return await _ocr(
+        response,
+        read_images,
+        mrz_only=mrzOnly and not isIdCard,
+        fields=selected,
+        cache_control=cache_control,
+    )
+
+
+@app.post(
+    "/jobs",
+    response_model=JobStatus,
+    status_code=202,
+    summary="Queue a batch of passports or ID cards",
+    description=JOBS_DESC,
+    responses={
+        401: ERROR_401,
+        503: ERROR_503_JOBS,
+    }
+)
+async def create_job(
+    response: Response,
+    isIdCard: bool = Form(False, description="Every document of the job is an ID card"),
+    frontPhotos: List[UploadFile] = File(..., description="Passport photos, or ID card front photos"),
+    backPhotos: Optional[List[UploadFile]] = File(None, description="ID card back photos, in the order of frontPhotos"),
+    mrzOnly: bool = Form(False, description=MRZ_ONLY_DESC),
+    fields: Optional[str] = Form(None, description=FIELDS_DESC),
+):
+    _require_job_store()
+    selected = parse_fields(fields, isIdCard)
+    backs = backPhotos or []
+
+    if len(frontPhotos) > JOBS_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"A job holds at most {JOBS_MAX_DOCUMENTS} documents")
+    if isIdCard and len(backs) != len(frontPhotos):
+        raise HTTPException(status_code=400, detail="backPhotos must pair up with frontPhotos when isIdCard is true")
+
+    options = {
+        "mrz_only": mrzOnly and not isIdCard,
+        "fields": sorted(selected) if selected is not None else None,
+    }
+    try:
+        job_id = await asyncio.to_thread(
+            job_store.create, "id_card" if isIdCard else "passport", options, len(frontPhotos)
         )
+    except sqlite3.Error:
+        raise HTTPException(status_code=503, detail="Job queue is unavailable, retry later")
+
+    try:
+        # one document's buffers at a time; they are released once stored
+        for i, front in enumerate(frontPhotos):
+            with upload_budget.lease() as lease:
+                front_data = await read_image_upload(front, f"frontPhotos[{i}]", required=True, lease=lease)
+                back_data = None
+                if isIdCard:
+                    back_data = await read_image_upload(backs[i], f"backPhotos[{i}]", required=True, lease=lease)
+                await asyncio.to_thread(job_store.add, job_id, i, front_data, back_data)
+
+        await asyncio.to_thread(job_store.release, job_id)
+        status = await asyncio.to_thread(job_store.status, job_id)
 
-    except HTTPException:
-        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
+        # abandoned uploads (client gone) are dropped by the runner's trim
+        await asyncio.to_thread(job_store.delete, job_id)
+        if isinstance(e, UploadBudgetExceeded):
+            raise HTTPException(status_code=503, detail="Too many uploads in progress, retry later")
+        if isinstance(e, sqlite3.Error):
+            raise HTTPException(status_code=503, detail="Job queue is unavailable, retry later")
+        raise
+
+    metrics.inc("jobs.submitted")
+    metrics.inc("jobs.documents", len(frontPhotos))
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return status
+
+
+def _require_job_store() -> None:
+    if not job_store.available:
+        raise HTTPException(status_code=503, detail="Job queue is unavailable, retry later")
+
+
+async def _job_status(job_id: str) -> dict:
+    _require_job_store()
+    status = await asyncio.to_thread(job_store.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+@app.get(
+    "/jobs/{job_id}",
+    response_model=JobStatus,
+    summary="Job progress",
+    responses={
+        401: ERROR_401,
+        404: ERROR_404,
+        503: ERROR_503_JOBS,
+    }
+)
+async def get_job(job_id: str):
+    return await _job_status(job_id)
+
+
+async def _stream_results(job_id: str, offset: int) -> AsyncIterator[bytes]:
+    while True:
+        items = await asyncio.to_thread(job_store.results, job_id, offset, JOB_RESULTS_STREAM_PAGE)
+        if not items:
+            return
+        yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items).encode()
+        offset = items[-1]["index"] + 1
+
+
+@app.get(
+    "/jobs/{job_id}/results",
+    response_model=JobResultsPage,
+    summary="Job results",
+    description=JOB_RESULTS_DESC,
+    responses={
+        200: {"content": {"application/x-ndjson": {"schema": {"type": "string"}}}},
+        401: ERROR_401,
+        404: ERROR_404,
+        503: ERROR_503_JOBS,
+    }
+)
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Index of the first document"),
+    limit: int = Query(100, ge=1, le=1000, description="Documents per page"),
+    format: Literal["json", "jsonl"] = Query("json", description="`jsonl` streams all results from `offset` on"),
+):
+    status = await _job_status(job_id)
+
+    if format == "jsonl":
+        return StreamingResponse(_stream_results(job_id, offset), media_type="application/x-ndjson")
+
+    items = await asyncio.to_thread(job_store.results, job_id, offset, limit)
+    total = status["total"]
+    return {
+        "job_id": job_id,
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "next_offset": offset + limit if offset + limit < total else None,
+        "items": items,
+    }
+
+
+@app.get(
+    "/metrics",
+    response_model=MetricsResponse,
+    summary="Worker metrics",
+    description="Counters and timings of the uvicorn worker that served the request.",
+    responses={
+        401: ERROR_401
+    }
+)
+async def get_metrics():
+    return metrics.snapshot()
\ No newline at end of file
@@ -26,3 +26,6 @@ NOISE_SUBSTRINGS = (
     "CAMERA",
      "SCAN"
 )
+
+# Bump whenever parser output for the same tokens changes (invalidates cached results)
+PARSER_VERSION = "2"
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from .label_index import LabelIndex, LabelMatcher
+from .utils import norm_key, is_noise, sanitize_mrz, pick_date_any_format
+
+
+@dataclass(slots=True)
+class TokenFeatures:
+    text: str                               # stripped token
+    norm: str                               # norm_key(text)
+    _label: Optional[Tuple[str, float]]     # best label match, if any
+    date: Optional[str]                     # pick_date_any_format(text)
+    mrz: str                                # sanitize_mrz(text)
+    noise: bool
+    alpha: int
+    digits: int
+    # set by defer_labels: `label` is matched on first access
+    _matcher: Optional[Callable[[str], Optional[Tuple[str, float]]]] = None
+
+    @property
+    def label(self) -> Optional[Tuple[str, float]]:
+        if self._matcher is not None:
+            self._label = self._matcher(self.norm) if self.norm else None
+            self._matcher = None
+        return self._label
+
+    @label.setter
+    def label(self, value: Optional[Tuple[str, float]]) -> None:
+        self._label = value
+        self._matcher = None
+
+
+def token_features(
+    token: str,
+    labels: Optional[LabelIndex] = None,
+    threshold: float = 0.75,
+) -> TokenFeatures:
+    text = (token or "").strip()
+    nk = norm_key(text)
+    return TokenFeatures(
+        text=text,
+        norm=nk,
+        _label=labels.match(nk, threshold) if labels is not None and nk else None,
+        date=pick_date_any_format(text),
+        mrz=sanitize_mrz(text),
+        noise=is_noise(text),
+        alpha=sum(ch.isalpha() for ch in text),
+        digits=sum(ch.isdigit() for ch in text),
+    )
+
+
+def build_token_features(
+    tokens: List[str],
+    labels: Optional[LabelIndex] = None,
+    threshold: float = 0.75,
+) -> List[TokenFeatures]:
+    """
+    One pass over the document tokens; the extractors look features up
+    by index instead of recomputing them for every lookahead.
+    Without `labels`, no label matching is done (MRZ-only parsing, or
+    until the document variant is known, see defer_labels).
+    """
+    return [token_features(t, labels, threshold) for t in tokens]
+
+
+def defer_labels(feats: List[TokenFeatures], matcher: LabelMatcher) -> List[TokenFeatures]:
+    """
+    Lazy label matching: each token is matched against the full label
+    index when a parser first looks at its label. Tokens after the last
+    one a parser needs are never matched.
+    """
+    for f in feats:
+        f._matcher = matcher
+    return feats
@@ -1,6 +1,8 @@
+import re
 from typing import Dict, List
 from copy import deepcopy
 from .utils import norm_key
+from .label_index import LabelIndex
 
 def merge_labels(
   base: Dict[str, List[str]],
@@ -266,6 +268,29 @@ _LABELS_OLD = merge_labels(LABELS_BASE, LABELS_OLD_EXTRA)
 LABELS_OLD = merge_labels(_LABELS_OLD, LABELS_KARAKALPAK)
 LABELS_NEW = merge_labels(LABELS_BASE, LABELS_NEW_EXTRA)
 
+# Karakalpak-only spellings; LABELS_KARAKALPAK also carries the Uzbek/English
+# halves of the bilingual labels, which Uzbek passports print as well
+KARAKALPAK_MARKERS = (
+    "tuwilgan", "tuw1lgan", "sanesi", "akesin", "xesioin",
+    "berilgen", "ber1lgen", "waqti", "ameletiw", "amelet1w", "muddeti",
+)
+KARAKALPAK_WORDS = {"ati", "at1", "atti", "jeri", "jer", "amel", "etiw"}
+
+
+def is_karakalpak_variant(variant: str) -> bool:
+    words = re.split(r"[\s/]+", variant.lower())
+    joined = "".join(words)
+    return any(m in joined for m in KARAKALPAK_MARKERS) or any(w in KARAKALPAK_WORDS for w in words)
+
+
+# passport_number is never filled, and its spellings are card_number labels
+# too (which win on ties), so it is not needed even as a stop-label
+LABELS_UZ_PASSPORT = {
+    field: [v for v in variants if not is_karakalpak_variant(v)]
+    for field, variants in LABELS_OLD.items()
+    if field != "passport_number"
+}
+
 
 def build_labels_norm(
     labels: Dict[str, List[str]]
@@ -277,3 +302,9 @@ def build_labels_norm(
 
 LABELS_OLD_NORM = build_labels_norm(LABELS_OLD)
 LABELS_NEW_NORM = build_labels_norm(LABELS_NEW)
+LABELS_UZ_PASSPORT_NORM = build_labels_norm(LABELS_UZ_PASSPORT)
+
+# compiled once at import, see label_index.py
+LABELS_OLD_INDEX = LabelIndex(LABELS_OLD_NORM)
+LABELS_NEW_INDEX = LabelIndex(LABELS_NEW_NORM)
+LABELS_UZ_PASSPORT_INDEX = LabelIndex(LABELS_UZ_PASSPORT_NORM)
@@ -0,0 +1,102 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# axis-aligned token box in page pixels: x_min, y_min, x_max, y_max
+Box = Tuple[float, float, float, float]
+
+# how far below a label (in label heights) its value may start
+BELOW_MAX_LINES = 4.0
+
+
+def to_box(raw: Optional[Sequence]) -> Optional[Box]:
+    """
+    Accepts a rec_boxes entry ([x0, y0, x1, y1]) or a rec_polys entry
+    ([[x, y], ...]); anything else gives None.
+    """
+    if raw is None or len(raw) == 0:
+        return None
+    try:
+        if len(raw) == 4 and not isinstance(raw[0], (list, tuple)):
+            x0, y0, x1, y1 = (float(v) for v in raw)
+        else:
+            xs = [float(p[0]) for p in raw]
+            ys = [float(p[1]) for p in raw]
+            x0, y0, x1, y1 = min(xs), min(ys), max(xs), max(ys)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+
+def shift_boxes(boxes: List[Optional[Box]], dy: float) -> List[Optional[Box]]:
+    """Stacks a page below the previous one (ID card back under the front)."""
+    return [None if b is None else (b[0], b[1] + dy, b[2], b[3] + dy) for b in boxes]
+
+
+class SpatialIndex:
+    """
+    Token boxes sorted by vertical centre. A label's value is looked up
+    among the tokens to its right on the same line, then the tokens
+    starting below it that overlap it horizontally, nearest first.
+
+    Both lookups bisect the sorted centres, so a query costs
+    O(log n + k) for the k tokens inside the window.
+    """
+
+    def __init__(self, boxes: List[Optional[Box]]) -> None:
+        self.boxes = boxes
+        order = sorted((i for i, b in enumerate(boxes) if b is not None), key=lambda i: _cy(boxes[i]))
+        self._order = order
+        self._cy = [_cy(boxes[i]) for i in order]
+
+    @classmethod
+    def build(cls, boxes: Optional[List[Optional[Box]]], n: int) -> Optional["SpatialIndex"]:
+        """None unless there is one box per token and at least one is usable."""
+        if boxes is None or len(boxes) != n or not any(b is not None for b in boxes):
+            return None
+        return cls(boxes)
+
+    def _window(self, lo: float, hi: float) -> List[int]:
+        a = bisect_left(self._cy, lo)
+        b = bisect_right(self._cy, hi)
+        return self._order[a:b]
+
+    def right_of(self, i: int) -> List[int]:
+        x0, y0, x1, y1 = self.boxes[i]
+        h = y1 - y0
+        same_line = [
+            j for j in self._window(y0, y1)
+            if j != i and self.boxes[j][0] >= x1 - h / 2
+        ]
+        return sorted(same_line, key=lambda j: self.boxes[j][0])
+
+    def below(self, i: int) -> List[int]:
+        x0, y0, x1, y1 = self.boxes[i]
+        h = y1 - y0
+        cy = (y0 + y1) / 2
+        left, right = x0 - h, x1 + h
+        under = [
+            j for j in self._window(y1, y1 + BELOW_MAX_LINES * h)
+            if j != i
+            and self.boxes[j][1] >= cy
+            and self.boxes[j][0] < right and self.boxes[j][2] > left
+        ]
+        return sorted(under, key=lambda j: (round((_cy(self.boxes[j]) - cy) / h), self.boxes[j][0]))
+
+    def neighbours(self, i: int, limit: int) -> List[int]:
+        return (self.right_of(i) + self.below(i))[:limit]
+
+
+def _cy(b: Box) -> float:
+    return (b[1] + b[3]) / 2
+
+
+def lookahead(n: int, i: int, max_ahead: int, index: Optional[SpatialIndex] = None) -> Iterable[int]:
+    """
+    Candidate value positions for the label at `i`: spatial neighbours when
+    the token has a box, otherwise the next `max_ahead` tokens in reading order.
+    """
+    if index is not None and index.boxes[i] is not None:
+        return index.neighbours(i, max_ahead)
+    return range(i + 1, min(n, i + 1 + max_ahead))
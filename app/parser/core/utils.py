@@ -1,7 +1,12 @@
 import re
 from difflib import SequenceMatcher
-from typing import Optional, Tuple, Dict, List
+from typing import AbstractSet, Any, Optional, Set, Tuple, Dict, List, Union
 from .constants import _TRANSLATION_TABLE, NOISE_SUBSTRINGS
+from .label_index import LabelIndex
+
+MRZ_ALLOWED_RE = re.compile(r"[^A-Z0-9<]")
+DATE_DOT_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{4}\b")
+DATE_SPACE_RE = re.compile(r"\b(\d{2})\s+(\d{2})\s+(\d{4})\b")
 
 def norm_key(s: str, value: bool = False) -> str:
     s = (s or "").strip().lower()
@@ -30,23 +35,91 @@ def is_noise(t: str) -> bool:
             return True
     return False
 
+def sanitize_mrz(s: str) -> str:
+    s = (s or "").upper().strip()
+    s = s.replace(" ", "")
+    s = s.replace("«", "<").replace("‹", "<").replace("›", "<")
+    s = MRZ_ALLOWED_RE.sub("", s)
+    return s
+
+def to_ddmmyyyy_from_ddmmyyyy8(s: str) -> Optional[str]:
+    if not re.fullmatch(r"\d{8}", s or ""):
+        return None
+    dd = int(s[0:2])
+    mm = int(s[2:4])
+    yyyy = int(s[4:8])
+    if not (1900 <= yyyy <= 2100 and 1 <= mm <= 12 and 1 <= dd <= 31):
+        return None
+    if mm in (4, 6, 9, 11) and dd > 30:
+        return None
+    if mm == 2 and dd > 29:
+        return None
+    return f"{dd:02d}.{mm:02d}.{yyyy:04d}"
+
+def _digits8_from_token(token: str) -> Optional[str]:
+    t = token or ""
+    digits = re.sub(r"\D+", "", t)
+    return digits if len(digits) == 8 else None
+
+def pick_date_any_format(token: str) -> Optional[str]:
+    t = (token or "").strip()
+    m = DATE_DOT_RE.search(t)
+    if m:
+        return m.group(0)
+
+    m = DATE_SPACE_RE.search(t)
+    if m:
+        dd, mm, yyyy = m.group(1), m.group(2), m.group(3)
+        return f"{dd}.{mm}.{yyyy}"
+
+    d8 = _digits8_from_token(t)
+    if d8:
+        return to_ddmmyyyy_from_ddmmyyyy8(d8)
+
+    return None
+
+def _mrz_char_value(c: str) -> int:
+    if c.isdigit():
+        return int(c)
+    if "A" <= c <= "Z":
+        return ord(c) - ord("A") + 10
+    return 0  # '<'
+
+
+def mrz_check_digit(data: str) -> str:
+    weights = (7, 3, 1)
+    total = 0
+    for i, c in enumerate(data):
+        total += _mrz_char_value(c) * weights[i % 3]
+    return str(total % 10)
+
 def similarity(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
+# plain label dicts passed to best_label_match, compiled once each
+_compiled_labels: Dict[int, LabelIndex] = {}
+
 def best_label_match(
     token: str,
-    labels: Dict[str, List[str]],
+    labels: Union[LabelIndex, Dict[str, List[str]]],
     threshold: float = 0.75
 ) -> Optional[Tuple[str, float]]:
     nk = norm_key(token)
     if not nk:
         return None
-    best: Optional[Tuple[str, float]] = None
-    for field, norm_variants in labels.items():
-        for nv in norm_variants:
-            sv = similarity(nk, nv)
-            if best is None or sv > best[1]:
-                best = (field, sv)
-    if best and best[1] >= threshold:
-        return best
-    return None
+    if not isinstance(labels, LabelIndex):
+        index = _compiled_labels.get(id(labels))
+        # the index holds its dict, so the id cannot be reused while cached
+        if index is None or index.labels is not labels:
+            index = _compiled_labels[id(labels)] = LabelIndex(labels, memo=False)
+        labels = index
+    return labels.match(nk, threshold)
+
+# parser result keys that are not document fields
+RESULT_EXTRAS = ("raw", "mrz", "qr")
+
+def wanted_fields(result: Dict[str, Any], fields: Optional[AbstractSet[str]] = None) -> Set[str]:
+    """Fields a parser has to fill: the requested ones, or every field of `result`."""
+    if fields is None:
+        fields = result.keys()
+    return {f for f in fields if f not in RESULT_EXTRAS}
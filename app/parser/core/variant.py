@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+from .features import TokenFeatures
+from .label_index import LabelIndex
+from .labels import LABELS_OLD_INDEX, LABELS_UZ_PASSPORT_INDEX, is_karakalpak_variant
+
+UZ_PASSPORT = "uz_passport"
+KK_PASSPORT = "kk_passport"
+ID_CARD = "id_card"
+
+# normalized label fragments printed only on ID cards
+ID_CARD_ANCHORS = ("kartaraqami", "cardnumber", "shaxsiyraqami", "personalnumber")
+
+# Uzbek passport labels (Karakalpak passports print them too, next to their own)
+UZ_PASSPORT_ANCHORS = ("familiyasi", "otasiningismi", "tugilgansanasi", "kimtomonidan", "amalqilish")
+
+
+def _count_anchors(feats: List[TokenFeatures], anchors: tuple) -> int:
+    return sum(1 for f in feats if f.norm and any(a in f.norm for a in anchors))
+
+
+def detect_variant(feats: List[TokenFeatures]) -> Optional[str]:
+    """
+    Cheap per-document classification from MRZ issuer and label anchors.
+    Returns None when the evidence is weak or contradictory.
+    """
+    if any(f.norm and is_karakalpak_variant(f.text) for f in feats):
+        return KK_PASSPORT
+
+    td3_uzb = any(f.mrz.startswith("P<UZB") for f in feats)
+    td1_uzb = any(f.mrz.startswith("IUUZB") for f in feats)
+
+    if td1_uzb or _count_anchors(feats, ID_CARD_ANCHORS) >= 2:
+        return None if td3_uzb else ID_CARD
+
+    if td3_uzb or _count_anchors(feats, UZ_PASSPORT_ANCHORS) >= 2:
+        return UZ_PASSPORT
+
+    return None
+
+
+def passport_labels(variant: Optional[str]) -> LabelIndex:
+    """
+    Uzbek passports skip the Karakalpak-only spellings; everything else,
+    including undetected documents, matches against the full old-passport set.
+    """
+    if variant == UZ_PASSPORT:
+        return LABELS_UZ_PASSPORT_INDEX
+    return LABELS_OLD_INDEX
@@ -2,8 +2,16 @@ import re
 from typing import List, Optional, Dict, Any
 from datetime import date
 
+from ..core.utils import mrz_check_digit
+
 MRZ_ALLOWED_RE = re.compile(r"[^A-Z0-9<]")
 
+# fields process_mrz reads from the TD1 MRZ (printed on the back and in the QR code)
+MRZ_FIELDS = (
+    "card_number", "surname", "given_name", "date_of_birth",
+    "sex", "date_of_expiry", "personal_number",
+)
+
 """
     READ BLOCK
 """
@@ -32,7 +40,7 @@ def _find_mrz(tokens: List[str]) -> Optional[List[str]]:
 
 
 def _mrz_split(str: str) -> List[str]:
-    lines = str.split("\n")
+    lines = [l.strip() for l in str.split("\n") if l.strip()]
 
     return lines
 
@@ -54,20 +62,34 @@ def get_mrz(
     PROCESS BLOCK
 """
 
-def _char_value(c: str) -> int:
-    if c.isdigit():
-        return int(c)
-    if "A" <= c <= "Z":
-        return ord(c) - ord("A") + 10
-    return 0  # '<'
+def mrz_is_valid(mrz_lines: Optional[List[str]]) -> bool:
+    """
+    TD1 check digits: document number, date of birth, date of expiry
+    and the composite digit of line 2.
+    """
+    if not isinstance(mrz_lines, list) or len(mrz_lines) != 3:
+        return False
+
+    l1, l2, l3 = mrz_lines
+    if len(l1) != 30 or len(l2) != 30 or len(l3) != 30:
+        return False
+
+    if not l1.startswith("IUUZB"):
+        return False
+
+    checks = (
+        (l1[5:14], l1[14]),
+        (l2[0:6], l2[6]),
+        (l2[8:14], l2[14]),
+        (l1[5:30] + l2[0:7] + l2[8:15] + l2[18:29], l2[29]),
+    )
+    return all(mrz_check_digit(data) == digit for data, digit in checks)
 
 
-def _check_digit(data: str) -> str:
-    weights = (7, 3, 1)
-    total = 0
-    for i, c in enumerate(data):
-        total += _char_value(c) * weights[i % 3]
-    return str(total % 10)
+def qr_has_valid_mrz(qr: Optional[str]) -> bool:
+    if not qr:
+        return False
+    return mrz_is_valid(_mrz_split(qr))
 
 
 def _yyMMdd_to_ddmmyyyy(s: str)-> Optional[str]:
@@ -1,11 +1,14 @@
 import re
-from typing import List, Dict, Any, Optional
+from typing import AbstractSet, List, Dict, Any, Optional, Set
 
 from .date import classify_dates
 from .mrz import get_mrz, process_mrz
 
-from ..core.utils import is_noise, best_label_match, norm_key
-from ..core.labels import LABELS_NEW_NORM
+from ..core.features import TokenFeatures, build_token_features, defer_labels
+from ..core.label_index import LabelMatcher
+from ..core.spatial import Box, SpatialIndex, lookahead
+from ..core.utils import is_noise, norm_key, wanted_fields
+from ..core.labels import LABELS_NEW_INDEX
 
 DATE_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{4}\b")
 CARD_RE = re.compile(r"\b[A-Z]{2}\d{7}\b")
@@ -13,6 +16,9 @@ AUTHORITY_RE = re.compile(r"((MIA|MFA|IIV|IIB|GUVD|HIV|HV)\s*\d{3,20})")
 PERSONAL_NUMBER_RE = re.compile(r"(\b\d{14}\b)")
 SEX_RE  = re.compile(r"\b(AYOL|ERKAK)\b", re.IGNORECASE)
 
+# printed only on the back of the card and not part of its MRZ / QR code
+BACK_FIELDS = ("place_of_birth", "date_of_issue", "authority")
+
 def looks_like_value(token: str) -> bool:
     t = token.strip()
     if not t:
@@ -22,13 +28,19 @@ def looks_like_value(token: str) -> bool:
         return False
     return True
 
-def find_next_value(tokens: List[str], start: int, field: str) -> Optional[str]:
-    for j in range(start + 1, min(start + 5, len(tokens))):
-        t = tokens[j].strip()
-        if not t or is_noise(t):
+def find_next_value(
+    feats: List[TokenFeatures],
+    start: int,
+    field: str,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
+    for j in lookahead(len(feats), start, 4, index):
+        f = feats[j]
+        t = f.text
+        if not t or f.noise:
             continue
 
-        if best_label_match(t, LABELS_NEW_NORM) is not None:
+        if f.label is not None:
             continue
 
         if field in ("surname", "given_name", "patronymic", "place_of_birth"):
@@ -69,10 +81,19 @@ def find_next_value(tokens: List[str], start: int, field: str) -> Optional[str]:
 
 def parse_id_card(
     tokens: List[str],
-    qr: Optional[str] = None
+    qr: Optional[str] = None,
+    boxes: Optional[List[Optional[Box]]] = None,
+    fields: Optional[AbstractSet[str]] = None,
 ) -> Dict[str, Any]:
-
-    clean = [t for t in tokens if t is not None and t.strip() and not is_noise(t)]
+    """
+    `fields` limits parsing to those result keys ("raw" for the token list);
+    the others stay None. Only fields the MRZ / QR code left empty are
+    looked for, and token scanning stops once none is pending.
+    """
+
+    keep = [i for i, t in enumerate(tokens) if t is not None and t.strip() and not is_noise(t)]
+    clean = [tokens[i] for i in keep]
+    clean_boxes = [boxes[i] for i in keep] if boxes is not None and len(boxes) == len(tokens) else None
     result: Dict[str, Any] = {
         "surname": None,
         "given_name": None,
@@ -85,10 +106,11 @@ def parse_id_card(
         "place_of_birth": None,
         "authority": None,
         "personal_number": None,
-        "raw": tokens,
+        "raw": tokens if fields is None or "raw" in fields else None,
         "qr": qr,
         "mrz": None
     }
+    wanted = wanted_fields(result, fields)
 
     data: Dict[str, Any] = {}
     mrz_lines = get_mrz(tokens, qr)
@@ -99,22 +121,49 @@ def parse_id_card(
         result["mrz"] = data
 
         for k, v in data.items():
-            if v and result.get(k) is None:
+            if v and k in wanted and result.get(k) is None:
                 result[k] = v
 
-    for i, tok in enumerate(clean):
-        lm = best_label_match(tok, LABELS_NEW_NORM)
+    pending = {f for f in wanted if result[f] is None}
+    matcher = LabelMatcher(LABELS_NEW_INDEX, "id_card")
+
+    if pending:
+        _fill_pending(result, pending, clean, clean_boxes, matcher)
+
+    matcher.finish()
+    return result
+
+
+def _fill_pending(
+    result: Dict[str, Any],
+    pending: Set[str],
+    clean: List[str],
+    clean_boxes: Optional[List[Optional[Box]]],
+    matcher: LabelMatcher,
+) -> None:
+    feats = defer_labels(build_token_features(clean), matcher)
+    index = SpatialIndex.build(clean_boxes, len(feats))
+
+    def fill(field: str, val: Any) -> None:
+        result[field] = val
+        pending.discard(field)
+
+    for i, f in enumerate(feats):
+        if not pending:
+            return
+
+        lm = f.label
         if not lm:
             continue
 
         field, score = lm
 
-        if result[field] is not None:
+        if field not in pending:
             continue
 
-        val = find_next_value(clean, i, field)
-        if val and result.get(field) is None:
-            result[field] = val
+        val = find_next_value(feats, i, field, index)
+        if val:
+            fill(field, val)
 
     patterns = {
         "personal_number": PERSONAL_NUMBER_RE,
@@ -122,41 +171,34 @@ def parse_id_card(
     }
 
     for t in clean:
+        if not pending:
+            return
+
         for key, regex in patterns.items():
-            if result[key] is None:
+            if key in pending:
                 text = t.replace(" ", "") if key == "card_number" else t
                 m = regex.search(text)
                 if m:
-                    result[key] = m.group(0)
+                    fill(key, m.group(0))
 
-        if result["sex"] is None:
+        if "sex" in pending:
             t_upper = t.upper()
             if "ERKAK" in t_upper:
-                result["sex"] = "M"
+                fill("sex", "M")
             elif "AYOL" in t_upper:
-                result["sex"] = "F"
+                fill("sex", "F")
 
-        if result["authority"] is None:
+        if "authority" in pending:
             m = AUTHORITY_RE.search(t)
             if m:
                 val = m.group(0)
                 val = re.sub(r"\bH(?:I)?V\s*(\d)", r"IIV \1", val)
-                return val
-
-
-        if all(result.values()):
-            break
+                fill("authority", val)
 
-    if result["date_of_birth"] is None or result["date_of_issue"] is None or result["date_of_expiry"] is None:
+    dates = [d for d in ("date_of_birth", "date_of_issue", "date_of_expiry") if d in pending]
+    if dates:
         classified = classify_dates(clean)
-        
-        if result["date_of_birth"] is None and classified["date_of_birth"]:
-            result["date_of_birth"] = classified["date_of_birth"]
-        
-        if result["date_of_issue"] is None and classified["date_of_issue"]:
-            result["date_of_issue"] = classified["date_of_issue"]
-        
-        if result["date_of_expiry"] is None and classified["date_of_expiry"]:
-            result["date_of_expiry"] = classified["date_of_expiry"]
 
-    return result
+        for d in dates:
+            if classified[d]:
+                fill(d, classified[d])
@@ -1,43 +1,26 @@
 import re
-from typing import Any, Dict, List, Optional, Tuple
+from typing import AbstractSet, Any, Dict, List, Optional, Tuple
 
-from ..core.utils import is_noise, best_label_match, norm_key
-from ..core.labels import LABELS_OLD_NORM
+from ..core.features import TokenFeatures, build_token_features, defer_labels
+from ..core.label_index import LabelMatcher
+from ..core.spatial import Box, SpatialIndex, lookahead
+from ..core.utils import mrz_check_digit, to_ddmmyyyy_from_ddmmyyyy8, wanted_fields
+from ..core.variant import detect_variant, passport_labels
 
-MRZ_ALLOWED_RE = re.compile(r"[^A-Z0-9<]")
-DATE_DOT_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{4}\b")
-DATE_SPACE_RE = re.compile(r"\b(\d{2})\s+(\d{2})\s+(\d{4})\b")
 MRZ_LINE1_RE = re.compile(r"^P<[A-Z]{3}")
 MRZ_LINE2_RE = re.compile(r"^[A-Z0-9<]{40,50}$")
 PASSPORT_NO_RE = re.compile(r"\b[A-Z]{1,2}\d{7}\b")
 
+MRZ_FIELDS = (
+    "surname", "given_name", "patronymic", "card_number",
+    "date_of_birth", "sex", "date_of_expiry",
+)
+
 NAME_STOP = {
     "SM", "SUZB", "UZB", "P", "M", "F",
     "PASSPORT", "PASPORT", "TYPE", "COUNTRY", "CODE",
 }
 
-def _sanitize_mrz(s: str) -> str:
-    s = (s or "").upper().strip()
-    s = s.replace(" ", "")
-    s = s.replace("«", "<").replace("‹", "<").replace("›", "<")
-    s = MRZ_ALLOWED_RE.sub("", s)
-    return s
-
-def to_ddmmyyyy_from_ddmmyyyy8(s: str) -> Optional[str]:
-    if not re.fullmatch(r"\d{8}", s or ""):
-        return None
-    dd = int(s[0:2])
-    mm = int(s[2:4])
-    yyyy = int(s[4:8])
-    if not (1900 <= yyyy <= 2100 and 1 <= mm <= 12 and 1 <= dd <= 31):
-        return None
-    if mm in (4, 6, 9, 11) and dd > 30:
-        return None
-    if mm == 2 and dd > 29:
-        return None
-    return f"{dd:02d}.{mm:02d}.{yyyy:04d}"
-
-
 def to_ddmmyyyy_from_mrz_yymmdd(yymmdd: str, pivot: int = 50) -> Optional[str]:
     yymmdd = (yymmdd or "").strip()
     if not re.fullmatch(r"\d{6}", yymmdd):
@@ -56,44 +39,21 @@ def to_ddmmyyyy_from_mrz_yymmdd(yymmdd: str, pivot: int = 50) -> Optional[str]:
     return f"{dd:02d}.{mm:02d}.{yyyy:04d}"
 
 
-def _digits8_from_token(token: str) -> Optional[str]:
-    t = token or ""
-    digits = re.sub(r"\D+", "", t)
-    return digits if len(digits) == 8 else None
-
-
-def pick_date_any_format(token: str) -> Optional[str]:
-    t = (token or "").strip()
-    m = DATE_DOT_RE.search(t)
-    if m:
-        return m.group(0)
-
-    m = DATE_SPACE_RE.search(t)
-    if m:
-        dd, mm, yyyy = m.group(1), m.group(2), m.group(3)
-        return f"{dd}.{mm}.{yyyy}"
-
-    d8 = _digits8_from_token(t)
-    if d8:
-        return to_ddmmyyyy_from_ddmmyyyy8(d8)
-
-    return None
-
-
-def find_mrz_lines(tokens: List[str]) -> Tuple[Optional[str], Optional[str]]:
+def find_mrz_lines(feats: List[TokenFeatures]) -> Tuple[Optional[str], Optional[str]]:
     line1 = None
     line2 = None
 
     candidates: List[str] = []
-    for t in tokens:
-        st = _sanitize_mrz(t)
+    for f in feats:
+        st = f.mrz
         if MRZ_LINE1_RE.match(st) and len(st) >= 40:
             candidates.append(st)
         if MRZ_LINE2_RE.match(st) and len(st) >= 40 and not st.startswith("P<"):
             candidates.append(st)
 
-    for i in range(len(tokens) - 1):
-        st = _sanitize_mrz(tokens[i] + tokens[i + 1])
+    # sanitizing is per character, so joined tokens = joined sanitized tokens
+    for i in range(len(feats) - 1):
+        st = feats[i].mrz + feats[i + 1].mrz
         if MRZ_LINE1_RE.match(st) and len(st) >= 40:
             candidates.append(st)
         if MRZ_LINE2_RE.match(st) and len(st) >= 40 and not st.startswith("P<"):
@@ -153,16 +113,40 @@ def parse_mrz_td3(line1: Optional[str], line2: Optional[str]) -> Dict[str, Optio
     return out
 
 
-def _next_non_noise(tokens: List[str], start_i: int, max_ahead: int = 10) -> Optional[str]:
-    for j in range(start_i + 1, min(len(tokens), start_i + 1 + max_ahead)):
-        t = (tokens[j] or "").strip()
-        if not t:
+def td3_is_valid(line1: Optional[str], line2: Optional[str]) -> bool:
+    """
+    TD3 check digits: document number, date of birth, date of expiry
+    and the composite digit of line 2.
+    """
+    if not line1 or not line2 or not line1.startswith("P<"):
+        return False
+    if len(line2) != 44:
+        return False
+
+    checks = (
+        (line2[0:9], line2[9]),
+        (line2[13:19], line2[19]),
+        (line2[21:27], line2[27]),
+        (line2[0:10] + line2[13:20] + line2[21:43], line2[43]),
+    )
+    return all(mrz_check_digit(data) == digit for data, digit in checks)
+
+
+def _next_non_noise(
+    feats: List[TokenFeatures],
+    start_i: int,
+    max_ahead: int = 10,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[TokenFeatures]:
+    for j in lookahead(len(feats), start_i, max_ahead, index):
+        f = feats[j]
+        if not f.text:
             continue
-        if is_noise(t):
+        if f.noise:
             continue
-        if best_label_match(t, LABELS_OLD_NORM) is not None:
+        if f.label is not None:
             continue
-        return t
+        return f
     return None
 
 
@@ -171,112 +155,130 @@ def _is_sex_token(t: str) -> bool:
     return up in ("M", "F", "ERKAK", "AYOL")
 
 
-def _looks_like_place_value(t: str) -> bool:
-    if not t:
-        return False
-    s = t.strip()
+def _looks_like_place_value(f: TokenFeatures) -> bool:
+    s = f.text
     if len(s) < 3:
         return False
-    if pick_date_any_format(s):
+    if f.date:
         return False
     if _is_sex_token(s):
         return False
-    st = _sanitize_mrz(s)
+    st = f.mrz
     if MRZ_LINE1_RE.match(st) or (re.fullmatch(r"[A-Z0-9<]{40,50}", st) and "<" in st):
         return False
-    return any(ch.isalpha() for ch in s)
-
-
-def extract_place_top(tokens: List[str], label_i: int, max_ahead: int = 10) -> Optional[str]:
-    for j in range(label_i + 1, min(len(tokens), label_i + 1 + max_ahead)):
-        t = (tokens[j] or "").strip()
-        if not t or is_noise(t):
+    return f.alpha > 0
+
+
+def extract_place_top(
+    feats: List[TokenFeatures],
+    label_i: int,
+    max_ahead: int = 10,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
+    for j in lookahead(len(feats), label_i, max_ahead, index):
+        f = feats[j]
+        if not f.text or f.noise:
             continue
-        if best_label_match(t, LABELS_OLD_NORM) is not None:
+        if f.label is not None:
             break
-        if not _looks_like_place_value(t):
+        if not _looks_like_place_value(f):
             continue
-        return " ".join(t.split())
+        return " ".join(f.text.split())
     return None
 
 
-def extract_place_bottom(tokens: List[str], label_i: int, max_ahead: int = 14) -> Optional[str]:
+def extract_place_bottom(
+    feats: List[TokenFeatures],
+    label_i: int,
+    max_ahead: int = 14,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
     saw_sex = False
-    for j in range(label_i + 1, min(len(tokens), label_i + 1 + max_ahead)):
-        t = (tokens[j] or "").strip()
-        if not t or is_noise(t):
+    for j in lookahead(len(feats), label_i, max_ahead, index):
+        f = feats[j]
+        if not f.text or f.noise:
             continue
-        if best_label_match(t, LABELS_OLD_NORM) is not None:
+        if f.label is not None:
             break
 
-        if _is_sex_token(t):
+        if _is_sex_token(f.text):
             saw_sex = True
             continue
 
-        if pick_date_any_format(t):
+        if f.date:
             continue
 
-        if saw_sex and _looks_like_place_value(t):
-            return " ".join(t.split())
+        if saw_sex and _looks_like_place_value(f):
+            return " ".join(f.text.split())
 
-        if not saw_sex and _looks_like_place_value(t):
-            return " ".join(t.split())
+        if not saw_sex and _looks_like_place_value(f):
+            return " ".join(f.text.split())
 
     return None
 
 
-def _looks_like_name_value(v: str, min_len: int = 3) -> bool:
-    if not v:
+def _looks_like_name_value(f: TokenFeatures, min_len: int = 3) -> bool:
+    if not f.text:
         return False
 
-    s = " ".join(v.strip().split())
+    s = " ".join(f.text.split())
     up = s.upper()
 
     if len(re.sub(r"[^A-Za-z]", "", s)) < min_len:
         return False
 
-    if pick_date_any_format(s):
+    if f.date:
         return False
     if PASSPORT_NO_RE.search(up.replace(" ", "")):
         return False
-    st = _sanitize_mrz(s)
+    st = f.mrz
     if MRZ_LINE1_RE.match(st) or MRZ_LINE2_RE.match(st):
         return False
 
     if up in NAME_STOP:
         return False
 
-    return any(ch.isalpha() for ch in s)
-
-def _next_name_value(tokens: List[str], start_i: int, max_ahead: int = 10, min_len: int = 3) -> Optional[str]:
-    for j in range(start_i + 1, min(len(tokens), start_i + 1 + max_ahead)):
-        t = (tokens[j] or "").strip()
-        if not t:
+    return f.alpha > 0
+
+def _next_name_value(
+    feats: List[TokenFeatures],
+    start_i: int,
+    max_ahead: int = 10,
+    min_len: int = 3,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
+    for j in lookahead(len(feats), start_i, max_ahead, index):
+        f = feats[j]
+        if not f.text:
             continue
-        if is_noise(t):
+        if f.noise:
             continue
-        if best_label_match(t, LABELS_OLD_NORM) is not None:
+        if f.label is not None:
             continue 
 
-        v_clean = " ".join(t.split())
-
-        if _looks_like_name_value(v_clean, min_len=min_len):
-            return v_clean
+        if _looks_like_name_value(f, min_len=min_len):
+            return " ".join(f.text.split())
     return None
 
-def _extract_value_for_field(tokens: List[str], i: int, field: str) -> Optional[str]:
-    v = _next_non_noise(tokens, i)
-    if not v:
+def _extract_value_for_field(
+    feats: List[TokenFeatures],
+    i: int,
+    field: str,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
+    nf = _next_non_noise(feats, i, index=index)
+    if not nf:
         return None
+    v = nf.text
 
     if field in ("date_of_birth", "date_of_issue", "date_of_expiry"):
-        d = pick_date_any_format(v)
+        d = nf.date
         if d:
             return d
 
         v_digits = re.sub(r"\D+", "", v)
-        if len(v_digits) == 4 and i + 1 < len(tokens):
-            v2 = (tokens[i + 1] or "").strip()
+        if len(v_digits) == 4 and i + 1 < len(feats):
+            v2 = feats[i + 1].text
             v2_digits = re.sub(r"\D+", "", v2)
             if len(v2_digits) == 4:
                 joined = v_digits + v2_digits
@@ -308,8 +310,7 @@ def _extract_value_for_field(tokens: List[str], i: int, field: str) -> Optional[
         return None
 
     if field in ("surname", "given_name", "patronymic"):
-        v_clean = norm_key(v)
-        nv = _next_name_value(tokens, i, max_ahead=10, min_len=3)
+        nv = _next_name_value(feats, i, max_ahead=10, min_len=3, index=index)
         if not nv:
             return None
         return nv.upper()
@@ -323,17 +324,15 @@ AUTHORITY_STOP_WORDS = {
 }
 
 
-def _looks_like_location(t: str) -> bool:
-    if not t:
-        return False
-    s = t.strip()
+def _looks_like_location(f: TokenFeatures) -> bool:
+    s = f.text
     if len(s) < 4:
         return False
-    if is_noise(s):
+    if f.noise:
         return False
-    if pick_date_any_format(s):
+    if f.date:
         return False
-    st = _sanitize_mrz(s)
+    st = f.mrz
     if re.fullmatch(r"[A-Z0-9<]{40,60}", st):
         return False
     up = s.upper()
@@ -342,26 +341,26 @@ def _looks_like_location(t: str) -> bool:
     return False
 
 
-def _extract_authority_fallback(tokens: List[str]) -> Optional[str]:
-    for t in tokens:
-        s = " ".join((t or "").strip().split())
+def _extract_authority_fallback(feats: List[TokenFeatures]) -> Optional[str]:
+    for f in feats:
+        s = " ".join(f.text.split())
         up = s.upper()
         if re.fullmatch(r"(MIA|MFA|IIB|IIV|GUVD|PERSONALIZATION)\s*\d{3,20}", up):
             return s
     return None
 
 
-def _extract_place_of_birth_fallback(tokens: List[str]) -> Optional[str]:
-    for t in tokens:
-        if _looks_like_location(t):
-            return " ".join(t.strip().split())
+def _extract_place_of_birth_fallback(feats: List[TokenFeatures]) -> Optional[str]:
+    for f in feats:
+        if _looks_like_location(f):
+            return " ".join(f.text.split())
     return None
 
 
-def _extract_issue_date_fallback(tokens: List[str], dob: Optional[str], exp: Optional[str]) -> Optional[str]:
+def _extract_issue_date_fallback(feats: List[TokenFeatures], dob: Optional[str], exp: Optional[str]) -> Optional[str]:
     dates = []
-    for t in tokens:
-        d = pick_date_any_format(t)
+    for f in feats:
+        d = f.date
         if not d:
             continue
         if dob and d == dob:
@@ -388,55 +387,58 @@ def _extract_issue_date_fallback(tokens: List[str], dob: Optional[str], exp: Opt
     return dates[-1]
 
 
-def _looks_like_authority_piece(t: str) -> bool:
-    if not t:
-        return False
-    s = t.strip()
+def _looks_like_authority_piece(f: TokenFeatures) -> bool:
+    s = f.text
     if len(s) < 3:
         return False
 
-    st = _sanitize_mrz(s)
+    st = f.mrz
     if MRZ_LINE1_RE.match(st) or (MRZ_LINE2_RE.match(st) and len(st) >= 40):
         return False
 
     if PASSPORT_NO_RE.search(s.upper().replace(" ", "")):
         return False
 
-    digits = sum(ch.isdigit() for ch in s)
-    if digits >= 3:
+    if f.digits >= 3:
         return False
 
     up = s.upper()
     if any(w in up for w in AUTHORITY_STOP_WORDS):
         return False
 
-    return any(ch.isalpha() for ch in s)
+    return f.alpha > 0
 
 
 def _has_lowercase_letters(s: str) -> bool:
     return any(c.isalpha() and c.islower() for c in s)
 
 
-def _collect_authority(tokens: List[str], label_i: int, max_pieces: int = 6, max_ahead: int = 12) -> Optional[str]:
+def _collect_authority(
+    feats: List[TokenFeatures],
+    label_i: int,
+    max_pieces: int = 6,
+    max_ahead: int = 12,
+    index: Optional[SpatialIndex] = None,
+) -> Optional[str]:
     pieces: List[str] = []
-    for j in range(label_i + 1, min(len(tokens), label_i + 1 + max_ahead)):
-        t = (tokens[j] or "").strip()
-        if not t or is_noise(t):
+    for j in lookahead(len(feats), label_i, max_ahead, index):
+        f = feats[j]
+        if not f.text or f.noise:
             continue
 
-        if pick_date_any_format(t):
+        if f.date:
             continue
 
-        if best_label_match(t, LABELS_OLD_NORM) is not None:
+        if f.label is not None:
             break
 
-        if _has_lowercase_letters(t):
+        if _has_lowercase_letters(f.text):
             continue
 
-        if not _looks_like_authority_piece(t):
+        if not _looks_like_authority_piece(f):
             break
 
-        pieces.append(" ".join(t.split()))
+        pieces.append(" ".join(f.text.split()))
         if len(pieces) >= max_pieces:
             break
 
@@ -445,11 +447,20 @@ def _collect_authority(tokens: List[str], label_i: int, max_pieces: int = 6, max
     return " ".join(pieces)
 
 
-def parse_passport(tokens: List[str]) -> Dict[str, Any]:
-    clean = [t for t in (tokens or []) if t is not None and str(t).strip()]
-    clean = [str(t).strip() for t in clean]
+def _clean_tokens(
+    tokens: List[str],
+    boxes: Optional[List[Optional[Box]]] = None,
+) -> Tuple[List[str], Optional[List[Optional[Box]]]]:
+    tokens = tokens or []
+    keep = [i for i, t in enumerate(tokens) if t is not None and str(t).strip()]
+    clean = [str(tokens[i]).strip() for i in keep]
+    if boxes is None or len(boxes) != len(tokens):
+        return clean, None
+    return clean, [boxes[i] for i in keep]
+
 
-    result: Dict[str, Any] = {
+def _empty_result(tokens: List[str], fields: Optional[AbstractSet[str]] = None) -> Dict[str, Any]:
+    return {
         "surname": None,
         "given_name": None,
         "patronymic": None,
@@ -461,72 +472,118 @@ def parse_passport(tokens: List[str]) -> Dict[str, Any]:
         "authority": None,
         "place_of_birth": None,
         "mrz": {"line1": None, "line2": None},
-        "raw": tokens,
+        "raw": tokens if fields is None or "raw" in fields else None,
     }
 
-    mrz1, mrz2 = find_mrz_lines(clean)
+
+def parse_passport_mrz(
+    tokens: List[str],
+    fields: Optional[AbstractSet[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    MRZ-only parse: fills MRZ_FIELDS (those in `fields`, when given) if both
+    TD3 lines are found and all check digits verify, otherwise returns None.
+    """
+    clean, _boxes = _clean_tokens(tokens)
+    mrz1, mrz2 = find_mrz_lines(build_token_features(clean))
+    if not td3_is_valid(mrz1, mrz2):
+        return None
+
+    result = _empty_result(tokens, fields)
     result["mrz"]["line1"] = mrz1
     result["mrz"]["line2"] = mrz2
 
-    mrz_data = parse_mrz_td3(mrz1, mrz2)
-    for k, v in mrz_data.items():
-        if v and result.get(k) is None:
+    wanted = wanted_fields(result, fields)
+    for k, v in parse_mrz_td3(mrz1, mrz2).items():
+        if v and k in wanted:
             result[k] = v
 
-    for i, tok in enumerate(clean):
-        lm = best_label_match(tok, LABELS_OLD_NORM)
+    return result
+
+
+def parse_passport(
+    tokens: List[str],
+    boxes: Optional[List[Optional[Box]]] = None,
+    fields: Optional[AbstractSet[str]] = None,
+) -> Dict[str, Any]:
+    """
+    `boxes` (one per token, see core/spatial.py) switches the label -> value
+    lookahead from reading order to spatial neighbours.
+
+    `fields` limits parsing to those result keys ("raw" for the token list);
+    the others stay None. The MRZ is read only when it holds a requested
+    field. The label scan covers only fields still pending after the MRZ
+    and stops once none is left; labels are matched lazily (see
+    defer_labels), so tokens past that point are never matched.
+    """
+    clean, clean_boxes = _clean_tokens(tokens, boxes)
+    feats = build_token_features(clean)
+    result = _empty_result(tokens, fields)
+    wanted = wanted_fields(result, fields)
+
+    if wanted.intersection(MRZ_FIELDS):
+        mrz1, mrz2 = find_mrz_lines(feats)
+        result["mrz"]["line1"] = mrz1
+        result["mrz"]["line2"] = mrz2
+
+        mrz_data = parse_mrz_td3(mrz1, mrz2)
+        for k, v in mrz_data.items():
+            if v and k in wanted and result.get(k) is None:
+                result[k] = v
+
+    labels = passport_labels(detect_variant(feats))
+    pending = {f for f in wanted if result.get(f) is None}
+
+    matcher = LabelMatcher(labels, "passport")
+    defer_labels(feats, matcher)
+    index = SpatialIndex.build(clean_boxes, len(feats))
+
+    for i, f in enumerate(feats):
+        if not pending:
+            break
+        lm = f.label
         if not lm:
             continue
         field, _score = lm
-        
-        if result.get(field) is not None:
-            continue
-        val = _extract_value_for_field(clean, i, field)
 
-        if field == "place_of_birth":
-            top = extract_place_top(clean, i, max_ahead=10)
-            if top:
-                result["place_of_birth"] = top
-                continue
-
-            bottom = extract_place_bottom(clean, i, max_ahead=14)
-            if bottom:
-                result["place_of_birth"] = bottom
-                continue
-
-            if val:
-                result["place_of_birth"] = val
+        if field not in pending:
             continue
 
+        if field == "place_of_birth":
+            val = (
+                extract_place_top(feats, i, max_ahead=10, index=index)
+                or extract_place_bottom(feats, i, max_ahead=14, index=index)
+                or _extract_value_for_field(feats, i, field, index)
+            )
         elif field == "authority":
-            auth = _collect_authority(clean, i)
-            if auth:
-                result["authority"] = auth
-
-            continue
+            val = _collect_authority(feats, i, index=index)
+        else:
+            val = _extract_value_for_field(feats, i, field, index)
 
-        elif val:
+        if val:
             result[field] = val
+            pending.discard(field)
 
-    if result.get("place_of_birth") is None:
-        result["place_of_birth"] = _extract_place_of_birth_fallback(clean)
+    if "place_of_birth" in pending:
+        result["place_of_birth"] = _extract_place_of_birth_fallback(feats)
 
-    if result.get("date_of_issue") is None:
+    if "date_of_issue" in pending:
         result["date_of_issue"] = _extract_issue_date_fallback(
-            clean,
+            feats,
             dob=result.get("date_of_birth"),
             exp=result.get("date_of_expiry"),
         )
 
-    if result["card_number"] is None:
-        for t in clean:
-            up = t.upper().replace(" ", "")
+    if "card_number" in pending:
+        for f in feats:
+            up = f.text.upper().replace(" ", "")
             m = PASSPORT_NO_RE.search(up)
             if m:
                 result["card_number"] = m.group(0)
                 break
 
-    if result["authority"] is None:
-        result["authority"] = _extract_authority_fallback(clean)
+    if "authority" in pending:
+        result["authority"] = _extract_authority_fallback(feats)
 
+    matcher.finish()
     return result
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Any, List, Literal
+
+from .ocr_response import OcrResponse
+
+
+class JobStatus(BaseModel):
+    job_id: str = Field(examples=["3f2a9c1e0b7d4e5f8a6b2c1d0e9f8a7b"])
+    status: Literal["queued", "running", "completed"] = Field(
+        description="`completed` once every document is done or failed",
+    )
+    document_type: Literal["passport", "id_card"]
+    total: int = Field(description="Documents in the job")
+    queued: int
+    running: int
+    done: int
+    failed: int
+    created: float = Field(description="Submission time, Unix seconds")
+
+
+class JobError(BaseModel):
+    status_code: int = Field(examples=[422])
+    detail: Any = Field(description="Same as the `detail` of the corresponding `/ocr` error")
+
+
+class JobItem(BaseModel):
+    index: int = Field(description="Position of the document in the submitted batch")
+    status: Literal["queued", "running", "done", "failed"]
+    result: OcrResponse | None = None
+    error: JobError | None = None
+
+
+class JobResultsPage(BaseModel):
+    job_id: str
+    offset: int
+    limit: int
+    total: int
+    next_offset: int | None = Field(description="Offset of the next page; null on the last one")
+    items: List[JobItem]
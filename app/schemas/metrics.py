@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict
+
+
+class MetricsResponse(BaseModel):
+    counters: Dict[str, int] = Field(examples=[{"inference.rejected": 0}])
+    timings: Dict[str, Dict[str, float]] = Field(
+        description="count/total/max/avg per stage, in seconds unless the name says otherwise (e.g. `ocr.batch_size`)",
+        examples=[{"inference.wait": {"count": 10, "total": 0.42, "max": 0.2, "avg": 0.042}}],
+    )
+    gauges: Dict[str, Any] = Field(examples=[{"inference.queue_depth": 0}])
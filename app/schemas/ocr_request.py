@@ -1,11 +1,48 @@
-from typing import Optional, Union, Literal
+from typing import FrozenSet, Optional, Union, Literal
 
 from fastapi import UploadFile, File, Form, HTTPException, Depends
 
+from .ocr_response import IdCardResult, PassportResult
+
+
+MRZ_ONLY_DESC = (
+    "Passport only: read just the MRZ band and return MRZ fields "
+    "(names, card number, dates of birth/expiry, sex). "
+    "Falls back to full-page OCR when MRZ check digits fail"
+)
+
+FIELDS_DESC = (
+    "Comma-separated result fields to return, e.g. `card_number,date_of_birth`; "
+    "all others are null. `raw` adds the OCR tokens. Only the requested fields "
+    "are parsed, and MRZ fields alone are read from the MRZ band (passport) or "
+    "the QR code (ID card) when it verifies. Default: all fields and `raw`"
+)
+
+PASSPORT_FIELDS = frozenset(PassportResult.model_fields)
+ID_CARD_FIELDS = frozenset(IdCardResult.model_fields)
+
+
+def parse_fields(value: Optional[str], is_id_card: bool) -> Optional[FrozenSet[str]]:
+    """None when no selection was sent; 422 on unknown field names."""
+    if value is None or not value.strip():
+        return None
+
+    fields = frozenset(f.strip() for f in value.split(",") if f.strip())
+    allowed = ID_CARD_FIELDS if is_id_card else PASSPORT_FIELDS
+    unknown = fields - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))} (allowed: {', '.join(sorted(allowed))})",
+        )
+    return fields
+
 
 class OcrBaseForm:
     isIdCard: bool
     frontPhoto: UploadFile
+    mrzOnly: bool = False
+    fields: Optional[FrozenSet[str]] = None
 
 
 class PassportForm(OcrBaseForm):
@@ -13,9 +50,13 @@ class PassportForm(OcrBaseForm):
         self,
         isIdCard: Literal[False] = Form(..., description="Must be false for passport"),
         frontPhoto: UploadFile = File(..., description="Photo of passport. Recommended with upper part"),
+        mrzOnly: bool = Form(False, description=MRZ_ONLY_DESC),
+        fields: Optional[str] = Form(None, description=FIELDS_DESC),
     ):
         self.isIdCard = isIdCard
         self.frontPhoto = frontPhoto
+        self.mrzOnly = mrzOnly
+        self.fields = parse_fields(fields, is_id_card=False)
 
 
 class IdCardForm(OcrBaseForm):
@@ -26,10 +67,12 @@ class IdCardForm(OcrBaseForm):
         isIdCard: Literal[True] = Form(..., description="Must be true for ID card"),
         frontPhoto: UploadFile = File(..., description="Front photo of ID card"),
         backPhoto: UploadFile = File(..., description="Back photo of ID card"),
+        fields: Optional[str] = Form(None, description=FIELDS_DESC),
     ):
         self.isIdCard = isIdCard
         self.frontPhoto = frontPhoto
         self.backPhoto = backPhoto
+        self.fields = parse_fields(fields, is_id_card=True)
 
 
 OcrForm = Union[PassportForm, IdCardForm]
@@ -42,6 +85,8 @@ async def get_ocr_form(
         None,
         description="Back image (required if isIdCard=true)",
     ),
+    mrzOnly: bool = Form(False, description=MRZ_ONLY_DESC),
+    fields: Optional[str] = Form(None, description=FIELDS_DESC),
 ) -> OcrForm:
     """
     Factory dependency that emulates OpenAPI `oneOf`
@@ -57,9 +102,12 @@ async def get_ocr_form(
             isIdCard=isIdCard,
             frontPhoto=frontPhoto,
             backPhoto=backPhoto,
+            fields=fields,
         )
 
     return PassportForm(
         isIdCard=isIdCard,
         frontPhoto=frontPhoto,
+        mrzOnly=mrzOnly,
+        fields=fields,
     )
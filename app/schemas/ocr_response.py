@@ -6,7 +6,10 @@ DATE_RE = r"^\d{2}\.\d{2}\.\d{4}$"
 
 
 class DocumentBaseResult(BaseModel):
-    raw: list[str]
+    raw: list[str] | None = Field(
+        None,
+        description="OCR tokens; null when `fields` is sent without `raw`",
+    )
 
     surname: str | None = Field(examples=["ABDULBOQIYEV"])
     given_name: str | None = Field(examples=["FARRUX"])
@@ -52,9 +55,19 @@ class PassportResult(DocumentBaseResult):
     authority: str | None = Field(examples=["MIA 33222"])
 
 
+class OcrMeta(BaseModel):
+    resolution: int = Field(
+        description="Longer image side (px) of the OCR pass that produced the result",
+        examples=[960],
+    )
+    tier: Literal["fast", "full"] = Field(description="OCR model tier of that pass")
+    attempts: int = Field(description="OCR passes run for this document", examples=[1])
+
+
 class OcrBaseResponse(BaseModel):
     status: Literal["ok"]
     document_type: str
+    meta: OcrMeta | None = None
 
 
 
@@ -16,3 +16,72 @@ ERROR_401 = {
     },
 }
 
+class QualityError(BaseModel):
+    reason: str = Field(description="blurry, glare or too_dark", examples=["blurry"])
+    field: str = Field(examples=["frontPhoto"])
+    message: str = Field(examples=["frontPhoto is too blurry to read, retake the photo"])
+    value: float = Field(description="Measured sharpness, share of the largest highlight or brightness", examples=[8.3])
+    threshold: float = Field(examples=[20.0])
+
+class QualityErrorResponse(BaseModel):
+    detail: QualityError
+
+ERROR_422 = {
+    "model": QualityErrorResponse,
+    "description": "Photo refused by the quality gate before OCR (request validation errors also use 422)",
+    "content": {
+        "application/json": {
+            "examples": {
+                "blurry": {"value": {"detail": {
+                    "reason": "blurry", "field": "frontPhoto",
+                    "message": "frontPhoto is too blurry to read, retake the photo",
+                    "value": 8.3, "threshold": 20.0,
+                }}},
+                "glare": {"value": {"detail": {
+                    "reason": "glare", "field": "backPhoto",
+                    "message": "backPhoto has too much glare to read, retake the photo",
+                    "value": 0.21, "threshold": 0.08,
+                }}},
+            }
+        }
+    },
+}
+
+ERROR_404 = {
+    "model": ErrorResponse,
+    "description": "Unknown or expired job",
+    "content": {
+        "application/json": {
+            "examples": {
+                "not_found": {"value": {"detail": "Job not found"}},
+            }
+        }
+    },
+}
+
+ERROR_503 = {
+    "model": ErrorResponse,
+    "description": "OCR queue or upload memory budget is full, retry later",
+    "content": {
+        "application/json": {
+            "examples": {
+                "queue_full": {"value": {"detail": "OCR queue is full, retry later"}},
+                "upload_budget": {"value": {"detail": "Too many uploads in progress, retry later"}},
+            }
+        }
+    },
+}
+
+ERROR_503_JOBS = {
+    "model": ErrorResponse,
+    "description": "Job queue is unavailable or upload memory budget is full, retry later",
+    "content": {
+        "application/json": {
+            "examples": {
+                "job_queue": {"value": {"detail": "Job queue is unavailable, retry later"}},
+                "upload_budget": {"value": {"detail": "Too many uploads in progress, retry later"}},
+            }
+        }
+    },
+}
+
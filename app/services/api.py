@@ -1,15 +1,23 @@
 from fastapi import FastAPI, Depends
 from fastapi.openapi.utils import get_openapi
 
+from app.schemas.ocr_request import FIELDS_DESC
+
 from .auth import require_bearer_key
+from .jobs import JOBS_MAX_REQUEST_MB, jobs_lifespan
+from .upload_limit import UploadLimitMiddleware
 
 app = FastAPI(
     title="UzPassportReader",
     description="API for performing OCR on passport and ID card images",
     version="0.1.0",
-    dependencies=[Depends(require_bearer_key)]
+    dependencies=[Depends(require_bearer_key)],
+    lifespan=jobs_lifespan,
 )
 
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(UploadLimitMiddleware, max_bytes=JOBS_MAX_REQUEST_MB * 1024 * 1024, paths=("/jobs",))
+
 
 def custom_openapi():
     if app.openapi_schema:
@@ -31,6 +39,13 @@ def custom_openapi():
         "properties": {
             "isIdCard": {"type": "boolean", "const": False, "description": "Must be false for passport"},
             "frontPhoto": {"type": "string", "format": "binary", "description": "Photo of passport"},
+            "mrzOnly": {
+                "type": "boolean",
+                "default": False,
+                "description": "Return MRZ fields only, reading just the MRZ band. "
+                               "Falls back to full-page OCR when MRZ check digits fail",
+            },
+            "fields": {"type": "string", "description": FIELDS_DESC},
         },
         "required": ["isIdCard", "frontPhoto"],
     }
@@ -42,6 +57,7 @@ def custom_openapi():
             "isIdCard": {"type": "boolean", "const": True, "description": "Must be true for ID card"},
             "frontPhoto": {"type": "string", "format": "binary", "description": "Front photo of ID card"},
             "backPhoto": {"type": "string", "format": "binary", "description": "Back photo of ID card"},
+            "fields": {"type": "string", "description": FIELDS_DESC},
         },
         "required": ["isIdCard", "frontPhoto", "backPhoto"],
     }
@@ -74,6 +90,22 @@ def custom_openapi():
         },
     }
 
+    raw = schema["paths"].get("/ocr/raw", {}).get("post")
+    if raw is not None:
+        raw["requestBody"] = {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {
+                        "type": "string",
+                        "format": "binary",
+                        "description": "Passport photo, or for ID cards: "
+                                       "uint32 BE front length, front photo, uint32 BE back length, back photo",
+                    },
+                },
+            },
+        }
+
     app.openapi_schema = schema
     return app.openapi_schema
 
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from .metrics import metrics
+
+UPSTREAM_POLL = 0.002   # how often a waiting batch re-checks `upstream`
+
+
+class BatchScheduler:
+    """
+    Collects images submitted from several threads and runs them through
+    `predict` as one batch, either when `max_batch` images are pending or
+    when the oldest one has waited `max_wait` seconds.
+
+    `upstream` counts the work that may still submit images (e.g. busy
+    executor threads). When it is zero and nothing else is queued, the
+    batch runs at once instead of waiting out `max_wait` for images that
+    cannot come.
+
+    A single scheduler thread owns the model, so `predict` is never called
+    concurrently.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[List[Any]], List[Any]],
+        *,
+        max_batch: int,
+        max_wait: float,
+        name: str,
+        upstream: Optional[Callable[[], int]] = None,
+    ) -> None:
+        self._predict = predict
+        self._upstream = upstream
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, item: Any) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((item, fut, time.perf_counter()))
+        return fut
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    name=f"{self.name}-batcher",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch:
+            if self._upstream is not None and self._queue.empty() and not self._upstream():
+                metrics.inc(f"{self.name}.batch_early")
+                break
+
+            timeout = deadline - time.perf_counter()
+            if self._upstream is not None:
+                timeout = min(timeout, UPSTREAM_POLL)
+            try:
+                if timeout <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                if time.perf_counter() >= deadline:
+                    break
+
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            # callers that gave up (cancelled asyncio.wrap_future) drop out here;
+            # a running future can no longer be cancelled under set_result
+            batch = [b for b in self._collect() if b[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+
+            for _item, _fut, enqueued in batch:
+                metrics.observe(f"{self.name}.batch_wait", started - enqueued)
+
+            try:
+                results = self._predict([item for item, _fut, _t in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                for _item, fut, _t in batch:
+                    fut.set_exception(e)
+                metrics.inc(f"{self.name}.batch_errors")
+                continue
+
+            finished = time.perf_counter()
+            metrics.inc(f"{self.name}.batches")
+            metrics.inc(f"{self.name}.images", len(batch))
+            metrics.observe(f"{self.name}.batch_size", len(batch))
+            metrics.observe(f"{self.name}.batch_run", finished - started)
+
+            for (_item, fut, enqueued), res in zip(batch, results):
+                metrics.observe(f"{self.name}.latency", finished - enqueued)
+                fut.set_result(res)
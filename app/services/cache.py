@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.parser.core.constants import PARSER_VERSION
+
+from .metrics import metrics
+
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", "3600"))
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "256"))
+OCR_CACHE_MAX_ITEMS = int(os.getenv("OCR_CACHE_MAX_ITEMS", "10000"))
+OCR_CACHE_PATH = os.getenv(
+    "OCR_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "uzpassport_ocr_cache.sqlite3"),
+)
+
+_TRIM_EVERY = 100
+
+
+def result_key(document_type: str, *images: bytes, options: str = "") -> str:
+    h = hashlib.sha256()
+    h.update(f"{PARSER_VERSION}|{document_type}|{options}".encode())
+    for data in images:
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier result cache: an in-process LRU in front of a SQLite file
+    shared by all uvicorn workers on the host. Entries expire after `ttl`
+    seconds; each tier is trimmed to its own item limit.
+    """
+
+    def __init__(self, path: str, *, ttl: float, memory_items: int, max_items: int) -> None:
+        self.ttl = ttl
+        self.memory_items = max(0, memory_items)
+        self.max_items = max(0, max_items)
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        if path and self.max_items:
+            try:
+                self._db = self._connect(path)
+            except sqlite3.Error:
+                metrics.inc("cache.shared_unavailable")
+                self._db = None
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS results_created ON results(created)")
+        return db
+
+    @property
+    def size(self) -> int:
+        return len(self._memory)
+
+    def _memory_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            if item[0] <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return item[1]
+
+    def _memory_put(self, key: str, expires: float, value: Dict[str, Any]) -> None:
+        if not self.memory_items:
+            return
+        with self._lock:
+            self._memory[key] = (expires, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+                metrics.inc("cache.evicted.memory")
+
+    def _shared_get(self, key: str, now: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM results WHERE key = ? AND expires > ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[1], json.loads(row[0])
+
+    def _shared_put(self, key: str, expires: float, value: Dict[str, Any], now: float) -> None:
+        if self._db is None:
+            return
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires, created) VALUES (?, ?, ?, ?)",
+                (key, payload, expires, now),
+            )
+            self._puts += 1
+            if self._puts % _TRIM_EVERY == 0:
+                self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        cur = self._db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        expired = cur.rowcount
+        cur = self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            " SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_items,),
+        )
+        metrics.inc("cache.evicted.shared", max(0, expired) + max(0, cur.rowcount))
+
+    def get_sync(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+
+        value = self._memory_get(key, now)
+        if value is not None:
+            metrics.inc("cache.hit.memory")
+            return value
+
+        try:
+            shared = self._shared_get(key, now)
+        except sqlite3.Error:
+            metrics.inc("cache.errors")
+            shared = None
+
+        if shared is not None:
+            expires, value = shared
+            self._memory_put(key, expires, value)
+            metrics.inc("cache.hit.shared")
+            return value
+
+        metrics.inc("cache.miss")
+        return None
+
+    def put_sync(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        expires = now + self.ttl
+        self._memory_put(key, expires, value)
+        try:
+            self._shared_put(key, expires, value, now)
+        except sqlite3.Error:
+            metrics.inc("cache.errors")
+        metrics.inc("cache.store")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory_get(key, time.time())
+        if value is not None:
+            metrics.inc("cache.hit.memory")
+            return value
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.put_sync, key, value)
+
+
+result_cache: Optional[ResultCache] = None
+if OCR_CACHE and OCR_CACHE_TTL > 0:
+    result_cache = ResultCache(
+        OCR_CACHE_PATH,
+        ttl=OCR_CACHE_TTL,
+        memory_items=OCR_CACHE_MEMORY_ITEMS,
+        max_items=OCR_CACHE_MAX_ITEMS,
+    )
+    metrics.gauge("cache.memory_items", lambda: result_cache.size)
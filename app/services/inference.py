@@ -0,0 +1,69 @@
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .metrics import metrics
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "4"))
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "32"))
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class InferenceExecutor:
+    """
+    Thread pool for blocking decode/OCR work with a bounded backlog.
+    Keeps the event loop free to accept and validate other uploads.
+    """
+
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._queued + self._active >= self.workers + self.queue_size:
+                metrics.inc("inference.rejected")
+                raise InferenceQueueFull()
+            self._queued += 1
+
+        submitted = time.perf_counter()
+
+        def task() -> Any:
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            metrics.observe("inference.wait", started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe("inference.run", time.perf_counter() - started)
+                with self._lock:
+                    self._active -= 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, task)
+
+
+inference = InferenceExecutor(OCR_WORKERS, OCR_QUEUE_SIZE)
+
+metrics.gauge("inference.queue_depth", lambda: inference.queue_depth)
+metrics.gauge("inference.active", lambda: inference.active)
@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from .inference import InferenceQueueFull
+from .metrics import metrics, StageTimings
+from .pipeline import process_document
+
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(tempfile.gettempdir(), "uzpassport_jobs.sqlite3"),
+)
+# documents this worker OCRs at a time for jobs; 0 leaves draining to other workers
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "2"))
+# a claimed document whose worker died is picked up again after this long
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "300"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_MAX_DOCUMENTS = int(os.getenv("JOBS_MAX_DOCUMENTS", "500"))
+JOBS_MAX_REQUEST_MB = int(os.getenv("JOBS_MAX_REQUEST_MB", "512"))
+JOBS_RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", "72"))
+
+JOBS_POLL_SECONDS = 1.0      # idle drainer sleep between claims
+_TRIM_EVERY_SECONDS = 600
+_UPLOAD_TIMEOUT_SECONDS = 3600   # jobs still uploading after this were abandoned
+
+# item states: held (job still uploading) -> queued -> running -> done | failed
+HELD, QUEUED, RUNNING, DONE, FAILED = "held", "queued", "running", "done", "failed"
+
+
+class Claim(NamedTuple):
+    rowid: int
+    job_id: str
+    seq: int
+    front: bytes
+    back: Optional[bytes]
+    attempts: int
+    options: Dict[str, Any]
+
+
+class JobStore:
+    """
+    Jobs and their documents in a SQLite file shared by all uvicorn workers
+    on the host. Workers claim documents with a lease; a document whose
+    lease ran out (worker crashed or restarted) is claimed again, and the
+    attempt count fences off late writes from the previous holder.
+    Photos are dropped once a document is finished.
+    When the file can't be opened the store is unavailable and /jobs
+    answers 503; /ocr is not affected.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._trimmed = 0.0
+
+        try:
+            self._db = self._connect(path)
+        except sqlite3.Error:
+            metrics.inc("jobs.store_unavailable")
+            self._db = None
+
+    @property
+    def available(self) -> bool:
+        return self._db is not None
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " document_type TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " ready INTEGER NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " job_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " front BLOB,"
+            " back BLOB,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_until REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS items_claim ON items(state, lease_until)")
+        return db
+
+    def create(self, document_type: str, options: Dict[str, Any], total: int) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, document_type, options, total, ready, created) VALUES (?, ?, ?, ?, 0, ?)",
+                (job_id, document_type, json.dumps(options), total, time.time()),
+            )
+        return job_id
+
+    def add(self, job_id: str, seq: int, front: bytes, back: Optional[bytes]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO items (job_id, seq, state, front, back) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, HELD, front, back),
+            )
+
+    def release(self, job_id: str) -> None:
+        """Uploaded completely: its documents become claimable."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("UPDATE items SET state = ? WHERE job_id = ? AND state = ?", (QUEUED, job_id, HELD))
+                self._db.execute("UPDATE jobs SET ready = 1 WHERE id = ?", (job_id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def claim(self) -> Optional[Claim]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT i.rowid, i.job_id, i.seq, i.front, i.back, i.attempts, j.options"
+                    " FROM items i JOIN jobs j ON j.id = i.job_id"
+                    " WHERE i.state = ? OR (i.state = ? AND i.lease_until < ?)"
+                    " ORDER BY i.rowid LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE items SET state = ?, lease_until = ?, attempts = attempts + 1 WHERE rowid = ?",
+                        (RUNNING, now + JOBS_LEASE_SECONDS, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        rowid, job_id, seq, front, back, attempts, options = row
+        return Claim(rowid, job_id, seq, front, back, attempts + 1, json.loads(options))
+
+    def _settle(self, claim: Claim, sql: str, params: tuple) -> bool:
+        # only the current lease holder may write, see the attempts fence
+        with self._lock:
+            cur = self._db.execute(
+                f"UPDATE items SET {sql} WHERE rowid = ? AND state = ? AND attempts = ?",
+                (*params, claim.rowid, RUNNING, claim.attempts),
+            )
+        return cur.rowcount == 1
+
+    def finish(self, claim: Claim, result: Dict[str, Any]) -> bool:
+        return self._settle(
+            claim,
+            "state = ?, result = ?, front = NULL, back = NULL, lease_until = NULL",
+            (DONE, json.dumps(result, ensure_ascii=False)),
+        )
+
+    def fail(self, claim: Claim, status_code: int, detail: Any) -> bool:
+        return self._settle(
+            claim,
+            "state = ?, error = ?, front = NULL, back = NULL, lease_until = NULL",
+            (FAILED, json.dumps({"status_code": status_code, "detail": detail}, ensure_ascii=False)),
+        )
+
+    def retry(self, claim: Claim, *, count_attempt: bool = True) -> bool:
+        return self._settle(
+            claim,
+            "state = ?, lease_until = NULL, attempts = attempts - ?",
+            (QUEUED, 0 if count_attempt else 1),
+        )
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._db.execute(
+                "SELECT document_type, total, created FROM jobs WHERE id = ? AND ready = 1",
+                (job_id,),
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state",
+                (job_id,),
+            ).fetchall())
+
+        document_type, total, created = job
+        done, failed = counts.get(DONE, 0), counts.get(FAILED, 0)
+        running = counts.get(RUNNING, 0)
+        if done + failed == total:
+            status = "completed"
+        elif done or failed or running:
+            status = "running"
+        else:
+            status = "queued"
+
+        return {
+            "job_id": job_id,
+            "status": status,
+            "document_type": document_type,
+            "total": total,
+            "queued": counts.get(QUEUED, 0),
+            "running": running,
+            "done": done,
+            "failed": failed,
+            "created": created,
+        }
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, state, result, error FROM items"
+                " WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [
+            {
+                "index": seq,
+                "status": state if state != HELD else QUEUED,
+                "result": json.loads(result) if result is not None else None,
+                "error": json.loads(error) if error is not None else None,
+            }
+            for seq, state, result, error in rows
+        ]
+
+    def trim(self) -> None:
+        """Drops expired jobs and abandoned uploads, at most every few minutes."""
+        now = time.time()
+        if now - self._trimmed < _TRIM_EVERY_SECONDS:
+            return
+        self._trimmed = now
+
+        with self._lock:
+            stale = [r[0] for r in self._db.execute(
+                "SELECT id FROM jobs WHERE created < ? OR (ready = 0 AND created < ?)",
+                (now - JOBS_RETENTION_HOURS * 3600, now - _UPLOAD_TIMEOUT_SECONDS),
+            ).fetchall()]
+        for job_id in stale:
+            self.delete(job_id)
+        if stale:
+            metrics.inc("jobs.expired", len(stale))
+
+
+class JobRunner:
+    """
+    Drains the job queue through the regular OCR pipeline with `concurrency`
+    documents in flight per worker. Results go through the result cache like
+    /ocr requests. Rejected photos (4xx) fail their document right away;
+    other errors are retried up to JOBS_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, store: JobStore, concurrency: int) -> None:
+        self.store = store
+        self.concurrency = max(0, concurrency)
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._active = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def start(self) -> None:
+        if self._tasks or not self.store.available:
+            return
+        self._tasks = [asyncio.create_task(self._drain()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self) -> None:
+        while True:
+            try:
+                if not await self._step():
+                    await asyncio.sleep(JOBS_POLL_SECONDS)
+            except Exception:
+                # e.g. "database is locked"; a document claimed by this step
+                # is claimed again once its lease runs out
+                metrics.inc("jobs.errors")
+                await asyncio.sleep(JOBS_POLL_SECONDS)
+
+    async def _step(self) -> bool:
+        """Processes one document; False when there was none to claim."""
+        claim = await asyncio.to_thread(self.store.claim)
+        if claim is None:
+            await asyncio.to_thread(self.store.trim)
+            return False
+
+        self._active += 1
+        try:
+            await self._run(claim)
+        finally:
+            self._active -= 1
+        return True
+
+    async def _run(self, claim: Claim) -> None:
+        options = claim.options
+        fields = options.get("fields")
+        try:
+            response = await process_document(
+                claim.front,
+                claim.back,
+                StageTimings(),
+                mrz_only=options.get("mrz_only", False),
+                fields=frozenset(fields) if fields is not None else None,
+            )
+        except HTTPException as e:
+            await asyncio.to_thread(self.store.fail, claim, e.status_code, e.detail)
+            metrics.inc("jobs.failed")
+            return
+        except InferenceQueueFull:
+            # interactive traffic has the executor; try again later
+            await asyncio.to_thread(self.store.retry, claim, count_attempt=False)
+            metrics.inc("jobs.deferred")
+            await asyncio.sleep(JOBS_POLL_SECONDS)
+            return
+        except Exception as e:
+            if claim.attempts < JOBS_MAX_ATTEMPTS:
+                await asyncio.to_thread(self.store.retry, claim)
+                metrics.inc("jobs.retried")
+            else:
+                await asyncio.to_thread(self.store.fail, claim, 500, f"OCR processing failed: {str(e)}")
+                metrics.inc("jobs.failed")
+            return
+
+        if await asyncio.to_thread(self.store.finish, claim, response.model_dump(mode="json")):
+            metrics.inc("jobs.done")
+        else:
+            metrics.inc("jobs.lease_lost")
+
+
+job_store = JobStore(JOBS_DB_PATH)
+job_runner = JobRunner(job_store, JOBS_CONCURRENCY)
+metrics.gauge("jobs.active", lambda: job_runner.active)
+
+
+@asynccontextmanager
+async def jobs_lifespan(_app: Any) -> AsyncIterator[None]:
+    """Runs the job drainer for as long as the app serves requests."""
+    job_runner.start()
+    try:
+        yield
+    finally:
+        await job_runner.stop()
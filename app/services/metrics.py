@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Any, Callable, Dict
+
+
+class Metrics:
+    """
+    Process-local counters, timing aggregates and gauges.
+    Every uvicorn worker keeps its own registry.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+
+    def inc(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+            t["count"] += 1
+            t["total"] += value
+            if value > t["max"]:
+                t["max"] = value
+
+    def gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        self._gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                k: {**v, "avg": v["total"] / v["count"] if v["count"] else 0.0}
+                for k, v in self._timings.items()
+            }
+        gauges = {k: fn() for k, fn in self._gauges.items()}
+        return {"counters": counters, "timings": timings, "gauges": gauges}
+
+
+metrics = Metrics()
+
+
+class StageTimings:
+    """
+    Per-request stage durations. Stages may run on different executor
+    threads; each one is also aggregated into `metrics` as `stage.<name>`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def timed(self, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.add(name, time.perf_counter() - t0)
+
+        return wrapper
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = seconds
+        metrics.observe(f"stage.{name}", seconds)
+
+    def finish(self) -> None:
+        self.add("total", time.perf_counter() - self.started)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{k};dur={v * 1000:.1f}" for k, v in self.stages.items())
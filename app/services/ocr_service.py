@@ -1,18 +1,122 @@
-from typing import List
+import os
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
 import numpy as np
 from paddleocr import PaddleOCR
 
+from app.parser.core.spatial import Box, to_box
 
-ocr =  PaddleOCR(
+from .batching import BatchScheduler
+from .inference import inference
+from .metrics import metrics
+
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+OCR_BATCH_WAIT_MS = float(os.getenv("OCR_BATCH_WAIT_MS", "20"))
+
+# Two-tier cascade: mobile models first, the full pipeline only on escalation
+OCR_CASCADE = os.getenv("OCR_CASCADE", "1") == "1"
+OCR_FAST_DET_MODEL = os.getenv("OCR_FAST_DET_MODEL", "PP-OCRv5_mobile_det")
+OCR_FAST_REC_MODEL = os.getenv("OCR_FAST_REC_MODEL", "en_PP-OCRv5_mobile_rec")   # paddleocr >= 3.1.0
+OCR_FULL_DET_MODEL = os.getenv("OCR_FULL_DET_MODEL", "PP-OCRv5_server_det")
+OCR_FULL_REC_MODEL = os.getenv("OCR_FULL_REC_MODEL", "PP-OCRv5_server_rec")
+
+FAST = "fast"
+FULL = "full"
+
+_COMMON = dict(
     use_doc_orientation_classify=False,
     use_doc_unwarping=False,
     use_textline_orientation=False,
-    lang="en",
     device="cpu",
 )
 
 
-def extract_texts(img: np.ndarray) -> List[str]:
-    result = ocr.predict(input=img)
-    api_response = [res.json for res in result]
-    return api_response[0].get("res", {}).get("rec_texts", []) if api_response else []
+class OcrTier:
+    """
+    One PaddleOCR pipeline behind its own batch scheduler. The model is
+    created on the first batch, by the scheduler thread that owns it.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], PaddleOCR]) -> None:
+        self.name = name
+        self._factory = factory
+        self._model: Optional[PaddleOCR] = None
+        self._lock = threading.Lock()
+        self.scheduler = BatchScheduler(
+            self._predict_batch,
+            max_batch=OCR_BATCH_SIZE,
+            max_wait=OCR_BATCH_WAIT_MS / 1000.0,
+            name=f"ocr.{name}",
+            # images come from pipeline stages running on the inference executor
+            upstream=lambda: inference.active + inference.queue_depth,
+        )
+        metrics.gauge(f"ocr.{name}.pending", lambda: self.scheduler.pending)
+
+    @property
+    def model(self) -> PaddleOCR:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def _predict_batch(self, images: List[np.ndarray]) -> List[Dict[str, Any]]:
+        result = self.model.predict(input=images)
+        return [res.json.get("res", {}) for res in result]
+
+    def submit(self, img: np.ndarray) -> "Future[Dict[str, Any]]":
+        return self.scheduler.submit(img)
+
+
+tiers: Dict[str, OcrTier] = {
+    FAST: OcrTier(FAST, lambda: PaddleOCR(
+        text_detection_model_name=OCR_FAST_DET_MODEL,
+        text_recognition_model_name=OCR_FAST_REC_MODEL,
+        **_COMMON,
+    )),
+    FULL: OcrTier(FULL, lambda: PaddleOCR(
+        text_detection_model_name=OCR_FULL_DET_MODEL,
+        text_recognition_model_name=OCR_FULL_REC_MODEL,
+        **_COMMON,
+    )),
+}
+
+# first tier tried for every image
+FIRST_TIER = FAST if OCR_CASCADE else FULL
+
+
+@dataclass(slots=True)
+class OcrToken:
+    text: str
+    score: float
+    box: Optional[Box]
+
+
+def _tokens(res: Dict[str, Any]) -> List[OcrToken]:
+    texts = res.get("rec_texts", [])
+    scores = res.get("rec_scores", [])
+    boxes = res.get("rec_boxes", [])
+    if len(boxes) != len(texts):
+        boxes = res.get("rec_polys", [])
+
+    return [
+        OcrToken(
+            text=text,
+            score=float(scores[i]) if i < len(scores) else 0.0,
+            box=to_box(boxes[i]) if i < len(boxes) else None,
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+async def extract_tokens(img: np.ndarray, tier: str = FIRST_TIER) -> List[OcrToken]:
+    # awaited on the event loop: no executor thread is held while the image
+    # waits for its batch, so concurrent requests can fill one
+    return _tokens(await asyncio.wrap_future(tiers[tier].submit(img)))
+
+
+async def extract_texts(img: np.ndarray, tier: str = FIRST_TIER) -> List[str]:
+    return [t.text for t in await extract_tokens(img, tier)]
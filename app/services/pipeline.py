@@ -0,0 +1,341 @@
+import os
+import re
+import time
+import asyncio
+from typing import AbstractSet, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.parser.core.label_index import label_comparison_stats, label_memo_stats
+from app.parser.core.spatial import shift_boxes
+from app.parser.id_card.mrz import MRZ_FIELDS as ID_CARD_MRZ_FIELDS, qr_has_valid_mrz
+from app.parser.id_card.parser import BACK_FIELDS, parse_id_card
+from app.parser.passport.parser import MRZ_FIELDS, parse_passport, parse_passport_mrz, td3_is_valid
+from app.image_processing.preprocessing import MAX_SIDE_PX, downscale, prepare_image
+from app.image_processing.qr import extract_qr
+from app.image_processing.mrz_band import crop_mrz_band
+from app.schemas.ocr_response import IdCardResponse, OcrMeta, OcrResponse, PassportResponse
+
+from .cache import result_cache, result_key
+from .inference import inference
+from .metrics import metrics, StageTimings
+from .ocr_service import FIRST_TIER, FULL, OcrToken, extract_texts, extract_tokens
+from .singleflight import SingleFlight
+
+# Skip back-side OCR when the QR code carries a checksum-valid MRZ and
+# no field printed only on the back is requested.
+ID_CARD_QR_FAST_PATH = os.getenv("ID_CARD_QR_FAST_PATH", "1") == "1"
+
+# Pair labels with values by OCR box geometry instead of reading order.
+SPATIAL_PAIRING = os.getenv("SPATIAL_PAIRING", "1") == "1"
+
+# Re-read with the full OCR tier when a required field is empty or a token
+# behind a required field / the MRZ was recognized below this score.
+OCR_ESCALATE_SCORE = float(os.getenv("OCR_ESCALATE_SCORE", "0.85"))
+# shorter values (sex "M") must match a low-score token whole, not inside it
+ESCALATE_MIN_SUBSTRING = 4
+REQUIRED_FIELDS = ("card_number", "date_of_birth", "surname")
+
+
+def _ladder(value: str) -> Tuple[int, ...]:
+    steps = sorted({min(int(v), MAX_SIDE_PX) for v in value.split(",") if v.strip()})
+    return tuple(steps) or (MAX_SIDE_PX,)
+
+
+# OCR resolution steps (longer side, px); the next step runs only when the
+# previous one left required fields empty or the MRZ failed its checksums.
+OCR_LADDER_PASSPORT = _ladder(os.getenv("OCR_LADDER_PASSPORT", "960,2000"))
+OCR_LADDER_ID_CARD = _ladder(os.getenv("OCR_LADDER_ID_CARD", "960,2000"))
+
+in_flight = SingleFlight("ocr.singleflight")
+metrics.gauge("ocr.singleflight.in_flight", lambda: in_flight.in_flight)
+metrics.gauge("labels.memo", label_memo_stats)
+metrics.gauge("labels.comparisons", label_comparison_stats)
+
+
+async def _stage(timings: StageTimings, name: str, fn: Callable[..., Any], *args: Any) -> Any:
+    return await inference.run(timings.timed(name, fn), *args)
+
+
+def _split(tokens: List[OcrToken]) -> Tuple[List[str], Optional[List[Any]]]:
+    texts = [t.text for t in tokens]
+    return texts, [t.box for t in tokens] if SPATIAL_PAIRING else None
+
+
+def _clip(ladder: Tuple[int, ...], *images: Any) -> Tuple[int, ...]:
+    """Steps above the prepared image size would OCR the same pixels again."""
+    top = max(max(img.shape[:2]) for img in images)
+    return tuple(sorted({min(side, top) for side in ladder}))
+
+
+def _attempts(ladder: Tuple[int, ...]) -> List[Tuple[str, int]]:
+    """Every ladder step on the first tier, then the top step on the full tier."""
+    attempts = [(FIRST_TIER, side) for side in ladder]
+    if FIRST_TIER != FULL:
+        attempts.append((FULL, ladder[-1]))
+    return attempts
+
+
+def _ocr_stage(name: str, tier: str, side: int, ladder: Tuple[int, ...]) -> str:
+    if tier == FIRST_TIER and side == ladder[0]:
+        return name
+    return f"{name}_{side}" if tier == FIRST_TIER else f"{name}_{side}_{tier}"
+
+
+async def _ocr_at(
+    timings: StageTimings,
+    name: str,
+    img: Any,
+    side: int,
+    tier: str,
+) -> Tuple[List[OcrToken], int]:
+    """
+    OCR `img` downscaled to `side`; also returns the height the boxes refer to.
+    Only the downscale takes an executor thread, the OCR call waits on the
+    tier's batch scheduler.
+    """
+    started = time.perf_counter()
+    small = await inference.run(downscale, img, side)
+    tokens = await extract_tokens(small, tier)
+    timings.add(name, time.perf_counter() - started)
+    return tokens, small.shape[0]
+
+
+def _required(fields: Optional[AbstractSet[str]]) -> Tuple[str, ...]:
+    """With a field selection, every requested field is required."""
+    if fields is None:
+        return REQUIRED_FIELDS
+    return tuple(sorted(f for f in fields if f != "raw"))
+
+
+def _needs_back_ocr(fields: Optional[AbstractSet[str]]) -> bool:
+    """Back-only fields, and raw tokens, cannot come from the QR MRZ and the front."""
+    if fields is None:
+        return True
+    return "raw" in fields or any(f in fields for f in BACK_FIELDS)
+
+
+def _compact(s: str) -> str:
+    return re.sub(r"[^A-Z0-9<]", "", s.upper())
+
+
+def _escalation_reason(
+    tokens: List[OcrToken],
+    result: Dict[str, Any],
+    required: Tuple[str, ...] = REQUIRED_FIELDS,
+) -> Optional[str]:
+    if any(not result.get(f) for f in required):
+        return "missing_field"
+
+    mrz = result.get("mrz") or {}
+    if mrz.get("line1") and mrz.get("line2") and not td3_is_valid(mrz["line1"], mrz["line2"]):
+        return "mrz_checksum"
+
+    values = [_compact(str(result[f])) for f in required]
+    long_values = [v for v in values if len(v) >= ESCALATE_MIN_SUBSTRING]
+    short_values = {v for v in values if len(v) < ESCALATE_MIN_SUBSTRING}
+    for t in tokens:
+        if t.score >= OCR_ESCALATE_SCORE:
+            continue
+        c = _compact(t.text)
+        if len(c) >= 30 or c in short_values or any(v in c for v in long_values):
+            return "low_score"
+    return None
+
+
+Read = Callable[[str, int], Awaitable[Tuple[List[OcrToken], Dict[str, Any]]]]
+
+
+async def _cascade(
+    read: Read,
+    ladder: Tuple[int, ...],
+    required: Tuple[str, ...] = REQUIRED_FIELDS,
+) -> Tuple[Dict[str, Any], OcrMeta]:
+    """
+    Runs `read` (OCR + parse) up the resolution ladder on the first tier,
+    then on the full tier, and stops at the first complete result.
+    The last attempt is always accepted.
+    """
+    attempts = _attempts(ladder)
+    for n, (tier, side) in enumerate(attempts, 1):
+        tokens, result = await read(tier, side)
+
+        reason = _escalation_reason(tokens, result, required)
+        if reason is None or n == len(attempts):
+            break
+        metrics.inc(f"ocr.cascade.escalated.{reason}")
+
+    metrics.inc(f"ocr.cascade.accepted.{tier}_{side}")
+    return result, OcrMeta(resolution=side, tier=tier, attempts=n)
+
+
+async def process_passport(
+    front_data: bytes,
+    timings: StageTimings,
+    *,
+    mrz_only: bool = False,
+    fields: Optional[AbstractSet[str]] = None,
+) -> PassportResponse:
+    front_img = await _stage(timings, "prepare_front", prepare_image, front_data, "frontPhoto", "passport")
+
+    # a selection of MRZ fields only needs the MRZ band
+    if fields is not None and fields <= set(MRZ_FIELDS):
+        mrz_only = True
+
+    if mrz_only:
+        band = await _stage(timings, "mrz_band", crop_mrz_band, front_img)
+        started = time.perf_counter()
+        band_texts = await extract_texts(band)
+        timings.add("ocr_mrz", time.perf_counter() - started)
+        result = parse_passport_mrz(band_texts, fields)
+        if result is not None:
+            metrics.inc("passport.mrz_fast_path")
+            meta = OcrMeta(resolution=max(band.shape[:2]), tier=FIRST_TIER, attempts=1)
+            return PassportResponse(status="ok", document_type="passport", result=result, meta=meta)
+
+        # checksums failed: the band text is unreliable, read the whole page
+        metrics.inc("passport.mrz_fallback")
+
+    ladder = _clip(OCR_LADDER_PASSPORT, front_img)
+
+    async def read(tier: str, side: int) -> Tuple[List[OcrToken], Dict[str, Any]]:
+        stage = _ocr_stage("ocr_front", tier, side, ladder)
+        tokens, _height = await _ocr_at(timings, stage, front_img, side, tier)
+        return tokens, parse_passport(*_split(tokens), fields=fields)
+
+    result, meta = await _cascade(read, ladder, _required(fields))
+    return PassportResponse(status="ok", document_type="passport", result=result, meta=meta)
+
+
+async def process_id_card(
+    front_data: bytes,
+    back_data: bytes,
+    timings: StageTimings,
+    *,
+    fields: Optional[AbstractSet[str]] = None,
+) -> IdCardResponse:
+    """
+    front: prepare -> OCR (first ladder step)
+    back:  prepare -> qr -> OCR
+    then both sides up the resolution ladder / model tiers until the result
+    is complete. Only the back waits for the QR verdict: the back is skipped
+    when the QR MRZ is valid and `fields` needs nothing printed only on the
+    back; otherwise a valid QR MRZ just stands in for the one in the
+    back-side tokens. When `fields` asks only for MRZ fields and the QR MRZ
+    is valid, no OCR runs at all.
+
+    Sides are prepared and read concurrently; OCR calls issued close together
+    end up in the same PaddleOCR batch (see app/services/batching.py).
+    Back-side boxes are stacked below the front page for spatial pairing.
+    """
+
+    async def back() -> Tuple[Any, Optional[str]]:
+        img = await _stage(timings, "prepare_back", prepare_image, back_data, "backPhoto", "id_card")
+        qr = await _stage(timings, "qr", extract_qr, img)
+        return img, qr
+
+    back_task = asyncio.ensure_future(back())
+    # front OCR started before the back is ready, by (tier, effective side)
+    early: Dict[Tuple[str, int], "asyncio.Future[Tuple[List[OcrToken], int]]"] = {}
+    try:
+        front_img = await _stage(timings, "prepare_front", prepare_image, front_data, "frontPhoto", "id_card")
+        front_top = max(front_img.shape[:2])
+
+        # a selection of MRZ fields may need no OCR at all, wait for the QR first
+        if fields is None or not fields <= set(ID_CARD_MRZ_FIELDS):
+            side = _clip(OCR_LADDER_ID_CARD, front_img)[0]
+            early[(FIRST_TIER, side)] = asyncio.ensure_future(
+                _ocr_at(timings, "ocr_front", front_img, side, FIRST_TIER)
+            )
+
+        back_img, qr = await back_task
+    except BaseException:
+        back_task.cancel()
+        for task in early.values():
+            task.cancel()
+        raise
+
+    if fields is not None and fields <= set(ID_CARD_MRZ_FIELDS) and qr_has_valid_mrz(qr):
+        metrics.inc("id_card.qr_only")
+        result = parse_id_card([], qr, fields=fields)
+        return IdCardResponse(status="ok", document_type="id_card", result=result)
+
+    if ID_CARD_QR_FAST_PATH and not _needs_back_ocr(fields) and qr_has_valid_mrz(qr):
+        metrics.inc("id_card.qr_fast_path")
+        back_img = None
+    else:
+        metrics.inc("id_card.back_ocr")
+
+    ladder = _clip(OCR_LADDER_ID_CARD, *(img for img in (front_img, back_img) if img is not None))
+
+    def ocr_front(tier: str, side: int) -> Awaitable[Tuple[List[OcrToken], int]]:
+        # steps at or above the front's size read the same pixels
+        task = early.pop((tier, min(side, front_top)), None)
+        if task is not None:
+            return task
+        return _ocr_at(timings, _ocr_stage("ocr_front", tier, side, ladder), front_img, side, tier)
+
+    async def ocr_back(tier: str, side: int) -> List[OcrToken]:
+        if back_img is None:
+            return []
+        stage = _ocr_stage("ocr_back", tier, side, ladder)
+        tokens, _height = await _ocr_at(timings, stage, back_img, side, tier)
+        return tokens
+
+    async def read(tier: str, side: int) -> Tuple[List[OcrToken], Dict[str, Any]]:
+        (front_tokens, front_height), back_tokens = await asyncio.gather(
+            ocr_front(tier, side),
+            ocr_back(tier, side),
+        )
+
+        texts, boxes = _split(front_tokens + back_tokens)
+        if boxes is not None:
+            boxes = boxes[:len(front_tokens)] + shift_boxes(boxes[len(front_tokens):], front_height)
+
+        return front_tokens + back_tokens, parse_id_card(texts, qr, boxes, fields)
+
+    result, meta = await _cascade(read, ladder, _required(fields))
+    return IdCardResponse(status="ok", document_type="id_card", result=result, meta=meta)
+
+
+async def process_document(
+    front_data: bytes,
+    back_data: Optional[bytes],
+    timings: StageTimings,
+    *,
+    mrz_only: bool = False,
+    fields: Optional[AbstractSet[str]] = None,
+    cache_read: bool = True,
+    cache_write: bool = True,
+) -> OcrResponse:
+    is_id_card = back_data is not None
+    document_type = "id_card" if is_id_card else "passport"
+    images = (front_data, back_data) if is_id_card else (front_data,)
+    options = "" if is_id_card else f"mrz_only={int(mrz_only)}"
+    if fields is not None:
+        options += f";fields={','.join(sorted(fields))}"
+
+    key = result_key(document_type, *images, options=options)
+
+    if result_cache and cache_read:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            timings.add("cache", 0.0)
+            model = IdCardResponse if is_id_card else PassportResponse
+            return model.model_validate(cached)
+
+    async def compute() -> OcrResponse:
+        if is_id_card:
+            response = await process_id_card(front_data, back_data, timings, fields=fields)
+        else:
+            response = await process_passport(front_data, timings, mrz_only=mrz_only, fields=fields)
+
+        if result_cache and cache_write:
+            await result_cache.put(key, response.model_dump(mode="json"))
+
+        return response
+
+    # identical uploads already being processed share that computation
+    started = time.perf_counter()
+    response = await in_flight.do(key, compute)
+    if not timings.stages:
+        timings.add("coalesced", time.perf_counter() - started)
+    return response
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+from app.image_processing.preprocessing import MAX_IMAGE_BYTES
+
+from .metrics import metrics
+
+# two photos plus multipart framing and the form fields
+MAX_REQUEST_BYTES = 2 * MAX_IMAGE_BYTES + 64 * 1024
+
+# upload buffers all in-flight requests of one worker may hold together
+UPLOAD_BUDGET_MB = int(os.getenv("UPLOAD_BUDGET_MB", "256"))
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class UploadBudgetExceeded(Exception):
+    pass
+
+
+class UploadBudget:
+    """Bytes of upload buffers currently held by requests of this worker."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def lease(self) -> "UploadLease":
+        return UploadLease(self)
+
+    def _take(self, n: int) -> None:
+        with self._lock:
+            if self._used + n > self.limit:
+                metrics.inc("upload.budget_rejected")
+                raise UploadBudgetExceeded()
+            self._used += n
+
+    def _release(self, n: int) -> None:
+        with self._lock:
+            self._used -= n
+
+
+class UploadLease:
+    """Reservations of one request, all returned when the request ends."""
+
+    def __init__(self, budget: UploadBudget) -> None:
+        self._budget = budget
+        self._held = 0
+
+    def take(self, n: int) -> None:
+        self._budget._take(n)
+        self._held += n
+
+    def close(self) -> None:
+        self._budget._release(self._held)
+        self._held = 0
+
+    def __enter__(self) -> "UploadLease":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+upload_budget = UploadBudget(UPLOAD_BUDGET_MB * 1024 * 1024)
+metrics.gauge("upload.budget_used", lambda: upload_budget.used)
+
+
+class UploadLimitMiddleware:
+    """
+    Refuses uploads whose Content-Length exceeds `max_bytes` before the
+    body is read, so an oversized request never gets buffered or spooled.
+    Bodies without a Content-Length (chunked) are counted while they stream
+    in and cut off at the same limit.
+    """
+
+    def __init__(self, app: Any, *, max_bytes: int = MAX_REQUEST_BYTES, paths: Tuple[str, ...] = ("/ocr",)) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is too large (>{self.max_bytes // (1024*1024)}MB)"
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            metrics.inc("upload.rejected.content_length")
+            await _reject(send, detail)
+            return
+
+        received = 0
+
+        async def counted_receive() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    metrics.inc("upload.rejected.streamed")
+                    # re-raised by the body parser, answered by the exception handler
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, counted_receive, send)
+
+
+async def _reject(send: Send, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})